@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (
+    BENCH_SCHEMA, ROOT, Dataset, DiscordRecorder, FakeInteraction, LocalPostgres,
+    db_round_trips, drop_schema, flush_renders, load_bot, prime_renders, reset_schema, with_search_path
+)
+
+REGISTER_BATCH = 50
+
+class Benchmark:
+    def __init__(self, bot1, recorder, dataset, guild_ids, iterations, seed):
+        self.bot1 = bot1
+        self.recorder = recorder
+        self.dataset = dataset
+        self.guild_ids = guild_ids
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.results = {}
+
+    async def run_once(self, setup, operation, trace_memory):
+        state = await setup() if setup else None
+        round_trips = db_round_trips(self.bot1)
+        calls = self.recorder.snapshot()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        await operation(state)
+        wall = time.perf_counter() - started
+        memory = None
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory = (current, peak)
+        discord = self.recorder.snapshot()
+        discord.subtract(calls)
+        return wall, db_round_trips(self.bot1) - round_trips, +discord, memory
+
+    async def measure(self, name, operation, setup=None):
+        walls = []
+        round_trips = []
+        discord_calls = []
+        for _ in range(self.iterations):
+            wall, trips, calls, _ = await self.run_once(setup, operation, False)
+            walls.append(wall * 1000)
+            round_trips.append(trips)
+            discord_calls.append(calls)
+
+        _, _, _, (retained, peak) = await self.run_once(setup, operation, True)
+
+        kinds = sorted({kind for calls in discord_calls for kind in calls})
+        self.results[name] = {
+            "iterations": self.iterations,
+            "wall_ms": {
+                "min": round(min(walls), 3),
+                "median": round(statistics.median(walls), 3),
+                "mean": round(statistics.fmean(walls), 3),
+                "max": round(max(walls), 3)
+            },
+            "db_round_trips": round(statistics.fmean(round_trips), 2),
+            "discord_calls": {
+                "total": round(statistics.fmean(sum(calls.values()) for calls in discord_calls), 2),
+                **{kind: round(statistics.fmean(calls[kind] for calls in discord_calls), 2) for kind in kinds}
+            },
+            "memory_kib": {
+                "peak": round(peak / 1024, 1),
+                "retained": round(retained / 1024, 1)
+            }
+        }
+        print(f"  {name}: {self.results[name]['wall_ms']['median']} мс, "
+              f"{self.results[name]['db_round_trips']} запросов к базе, "
+              f"{self.results[name]['discord_calls']['total']} вызовов Discord", file=sys.stderr)
+
+    async def setup_warmup(self):
+        self.bot1.active_lists.clear()
+        self.bot1.render_fingerprints.clear()
+
+    async def warmup(self, state):
+        await self.bot1.load_guild_lists(self.guild_ids)
+
+    async def setup_submit_rollback(self):
+        list_id = self.rng.choice(self.dataset.list_ids)
+        list_data = self.bot1.active_lists[list_id]
+        waiting = [user_id for user_id in list_data["participants"] if user_id not in list_data["rollbacks"]]
+        user_id = self.rng.choice(waiting or list(list_data["participants"]))
+        guild = self.dataset.guild_for(list_id)
+        return FakeInteraction(
+            self.recorder, guild, guild.get_member(user_id), list_data["channel_id"],
+            text_values={"rollback_text": "Синтетический откат для замера производительности"}
+        ), list_id, user_id in list_data["rollbacks"]
+
+    async def submit_rollback(self, state):
+        inter, list_id, replacing = state
+        await self.bot1.RollbackModal(list_id, inter.guild_id, replacing).callback(inter)
+        await flush_renders(self.bot1)
+
+    async def setup_register_users(self):
+        list_id = self.rng.choice(self.dataset.list_ids)
+        guild = self.dataset.guild_for(list_id)
+        members = [guild.add_member() for _ in range(REGISTER_BATCH)]
+        inter = FakeInteraction(self.recorder, guild, self.dataset.admins[guild.id], self.bot1.active_lists[list_id]["channel_id"])
+        return inter, list_id, " ".join(member.mention for member in members)
+
+    async def register_users(self, state):
+        inter, list_id, mentions = state
+        await self.bot1.register_user.callback(inter, list_id=list_id, users=mentions)
+        await flush_renders(self.bot1)
+
+    async def setup_full_sweep(self):
+        self.bot1.refreshed_at.clear()
+
+    async def full_sweep(self, state):
+        await self.bot1.auto_update_lists()
+        await flush_renders(self.bot1)
+
+    async def run(self):
+        await self.measure("startup_warmup", self.warmup, self.setup_warmup)
+        await self.measure("submit_rollback", self.submit_rollback, self.setup_submit_rollback)
+        await self.measure("register_50_users", self.register_users, self.setup_register_users)
+        await self.measure("full_sweep", self.full_sweep, self.setup_full_sweep)
+        return self.results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+async def run_benchmark(args, database_url):
+    await reset_schema(database_url)
+    recorder = DiscordRecorder()
+    # Локальные лимиты очереди исключаем: замеряется собственная работа бота, а не ожидание Discord.
+    bot1 = load_bot(with_search_path(database_url, BENCH_SCHEMA), recorder, {"CHANNEL_RATE_LIMIT": 1000000})
+    try:
+        await bot1.db.connect()
+        dataset = Dataset(bot1, recorder)
+        guild_ids = await dataset.seed(args.lists, args.participants, args.rollbacks, args.guilds, seed=args.seed)
+        await prime_renders(bot1, guild_ids)
+
+        print(f"📊 Данные: {args.lists} списков × {args.participants} участников × {args.rollbacks} откатов", file=sys.stderr)
+        results = await Benchmark(bot1, recorder, dataset, guild_ids, args.iterations, args.seed).run()
+        server_version = await bot1.db.fetchval('SHOW server_version')
+    finally:
+        if bot1.db.pool is not None:
+            await bot1.db.pool.close()
+        if not args.keep_data:
+            await drop_schema(database_url)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "postgres": server_version
+        },
+        "dataset": {
+            "guilds": len(guild_ids),
+            "lists": args.lists,
+            "participants_per_list": args.participants,
+            "rollbacks_per_list": args.rollbacks,
+            "seed": args.seed
+        },
+        "operations": results
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк бота откатов")
+    parser.add_argument("--lists", type=int, default=100, help="количество списков")
+    parser.add_argument("--participants", type=int, default=30, help="участников в каждом списке")
+    parser.add_argument("--rollbacks", type=int, default=20, help="откатов в каждом списке")
+    parser.add_argument("--guilds", type=int, default=None, help="сколько серверов из SERVER_CONFIGS использовать")
+    parser.add_argument("--iterations", type=int, default=20, help="повторов каждой операции")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="существующий Postgres вместо временного; данные пишутся в схему rollback_bench")
+    parser.add_argument("--pg-bin", help="каталог с initdb и pg_ctl, если их нет в PATH")
+    parser.add_argument("--keep-data", action="store_true", help="не удалять схему rollback_bench после прогона")
+    parser.add_argument("--output", help="файл для JSON-результатов (по умолчанию stdout)")
+    args = parser.parse_args()
+    args.rollbacks = min(args.rollbacks, args.participants)
+    return args
+
+def main():
+    args = parse_args()
+    postgres = None
+    database_url = args.database_url
+    if not database_url:
+        postgres = LocalPostgres(args.pg_bin)
+        database_url = postgres.start()
+
+    try:
+        report = asyncio.run(run_benchmark(args, database_url))
+    finally:
+        if postgres is not None:
+            postgres.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+import asyncio
+import importlib
+import itertools
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+import asyncpg
+import disnake
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_SCHEMA = "rollback_bench"
+
+def not_found():
+    return disnake.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), {"code": 10008, "message": "Unknown Message"})
+
+class DiscordRecorder:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.ids = itertools.count(1_200_000_000_000_000_000)
+        self.channels = {}
+        self.message_listeners = []
+
+    async def call(self, kind):
+        self.calls[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def snapshot(self):
+        return Counter(self.calls)
+
+    def channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(self, channel_id)
+        return channel
+
+    def message_changed(self, message):
+        for listener in self.message_listeners:
+            listener(message)
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, components=None):
+        self.channel = channel
+        self.id = next(channel.recorder.ids)
+        self.content = content
+        self.embed = embed
+        self.components = components
+
+    async def edit(self, content=None, embed=None, components=None, **kwargs):
+        await self.channel.recorder.call("message_edit")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+        if components is not None:
+            self.components = components
+        self.channel.recorder.message_changed(self)
+        return self
+
+    async def delete(self):
+        await self.channel.recorder.call("message_delete")
+        self.channel.messages.pop(self.id, None)
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            await self.channel.recorder.call("message_edit")
+            raise not_found()
+        return await message.edit(**kwargs)
+
+    async def delete(self):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            await self.channel.recorder.call("message_delete")
+            raise not_found()
+        await message.delete()
+
+class FakeChannel:
+    def __init__(self, recorder, channel_id):
+        self.recorder = recorder
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.messages = {}
+
+    async def send(self, content=None, embed=None, components=None, **kwargs):
+        await self.recorder.call("message_send")
+        message = FakeMessage(self, content, embed, components)
+        self.messages[message.id] = message
+        self.recorder.message_changed(message)
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.recorder.call("message_fetch")
+        message = self.messages.get(message_id)
+        if message is None:
+            raise not_found()
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+class FakeMember:
+    def __init__(self, guild, user_id, display_name=None, role_ids=()):
+        self.guild = guild
+        self.id = user_id
+        self.display_name = display_name or f"user{user_id % 100000}"
+        self.mention = f"<@{user_id}>"
+        self.roles = [FakeRole(role_id) for role_id in role_ids]
+
+class FakeGuild:
+    def __init__(self, recorder, guild_id):
+        self.recorder = recorder
+        self.id = guild_id
+        self.members = {}
+        self.next_user_id = itertools.count(guild_id % 10**6 * 10**11 + 10**17)
+
+    def add_member(self, role_ids=()):
+        member = FakeMember(self, next(self.next_user_id), role_ids=role_ids)
+        self.members[member.id] = member
+        return member
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def get_or_fetch_members(self, user_ids):
+        await self.recorder.call("guild_query_members")
+        return [self.members[user_id] for user_id in user_ids if user_id in self.members]
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    async def respond(self, kind, content=None):
+        await self.interaction.recorder.call(kind)
+        if not self.done:
+            self.done = True
+            self.interaction.responded_at = time.perf_counter()
+        if content is not None:
+            self.interaction.messages.append(content)
+
+    async def send_message(self, content=None, **kwargs):
+        await self.respond("interaction_response", content)
+
+    async def send_modal(self, modal):
+        self.interaction.modal = modal
+        await self.respond("interaction_response")
+
+    async def defer(self, **kwargs):
+        await self.respond("interaction_response")
+
+    async def edit_message(self, content=None, **kwargs):
+        await self.respond("interaction_response", content)
+
+    def is_done(self):
+        return self.done
+
+class FakeInteraction:
+    def __init__(self, recorder, guild, author, channel_id, text_values=None, custom_id=None):
+        self.recorder = recorder
+        self.id = next(recorder.ids)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.author = author
+        self.channel_id = channel_id
+        self.channel = recorder.channel(channel_id)
+        self.text_values = text_values or {}
+        self.component = types.SimpleNamespace(custom_id=custom_id)
+        self.message = FakeMessage(self.channel)
+        self.command_failed = False
+        self.created_at = time.perf_counter()
+        self.responded_at = None
+        self.modal = None
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = types.SimpleNamespace(send=self.followup_send)
+
+    async def followup_send(self, content=None, **kwargs):
+        await self.recorder.call("interaction_followup")
+        self.messages.append(content)
+
+    async def edit_original_response(self, content=None, **kwargs):
+        await self.recorder.call("interaction_edit")
+        self.messages.append(content)
+
+class LocalPostgres:
+    def __init__(self, bin_dir=None):
+        self.bin_dir = bin_dir
+        self.directory = None
+        self.data_dir = None
+
+    def binary(self, name):
+        path = os.path.join(self.bin_dir, name) if self.bin_dir else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise RuntimeError(f"{name} не найден: добавьте bin-каталог Postgres в PATH, укажите --pg-bin или --database-url")
+        return path
+
+    def start(self):
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            raise RuntimeError("initdb нельзя запускать от root: запустите бенчмарк от обычного пользователя или укажите --database-url")
+        self.directory = tempfile.mkdtemp(prefix="rollback-bench-")
+        self.data_dir = os.path.join(self.directory, "data")
+        subprocess.run(
+            [self.binary("initdb"), "-D", self.data_dir, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [
+                self.binary("pg_ctl"), "-D", self.data_dir, "-l", os.path.join(self.directory, "postgres.log"),
+                "-o", f"-k {self.directory} -c listen_addresses=''", "-w", "start"
+            ],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        return f"postgresql://postgres@/postgres?host={self.directory}"
+
+    def stop(self):
+        if self.data_dir and os.path.exists(self.data_dir):
+            subprocess.run([self.binary("pg_ctl"), "-D", self.data_dir, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+def with_search_path(database_url, schema):
+    parts = urlsplit(database_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != "search_path"]
+    query.append(("search_path", schema))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+async def reset_schema(database_url, schema=BENCH_SCHEMA):
+    connection = await asyncpg.connect(database_url)
+    try:
+        await connection.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+        await connection.execute(f'CREATE SCHEMA {schema}')
+    finally:
+        await connection.close()
+
+async def drop_schema(database_url, schema=BENCH_SCHEMA):
+    connection = await asyncpg.connect(database_url)
+    try:
+        await connection.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+    finally:
+        await connection.close()
+
+def load_bot(database_url, recorder, settings=None):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for key, value in (settings or {}).items():
+        os.environ.setdefault(key, str(value))
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    bot1 = importlib.import_module("bot1")
+    bot1.bot.get_channel = recorder.channel
+    bot1.bot.get_partial_messageable = recorder.channel
+
+    async def fetch_user(user_id):
+        await recorder.call("fetch_user")
+        raise not_found()
+
+    bot1.bot.fetch_user = fetch_user
+    return bot1
+
+class Dataset:
+    def __init__(self, bot1, recorder):
+        self.bot1 = bot1
+        self.recorder = recorder
+        self.guilds = {}
+        self.admins = {}
+        self.list_ids = []
+
+    def guild_for(self, list_id):
+        return self.guilds[self.bot1.active_lists[list_id]["guild_id"]]
+
+    def add_guild(self, guild_id):
+        guild = self.guilds[guild_id] = FakeGuild(self.recorder, guild_id)
+        config = self.bot1.SERVER_CONFIGS[guild_id]
+        if config.get("admin_ids"):
+            admin = FakeMember(guild, config["admin_ids"][0], "admin")
+            guild.members[admin.id] = admin
+        else:
+            admin = guild.add_member(role_ids=config["admin_role_ids"][:1])
+        self.admins[guild_id] = admin
+        self.bot1.bot.get_guild = self.guilds.get
+        return guild
+
+    async def seed(self, lists, participants, rollbacks, guild_count=None, channels_per_guild=3, seed=0):
+        rng = random.Random(seed)
+        guild_ids = list(self.bot1.SERVER_CONFIGS)[:guild_count or None]
+        for guild_id in guild_ids:
+            self.add_guild(guild_id)
+
+        now = datetime.now()
+        list_rows = []
+        for index in range(lists):
+            guild_id = guild_ids[index % len(guild_ids)]
+            event_at = (now + timedelta(days=index % 30)).replace(hour=18, minute=0, second=0, microsecond=0)
+            list_rows.append((
+                f"bench{index:05d}",
+                f"18:00 | {event_at:%d.%m.%Y} | Событие {index} | Сервер {index % 7}",
+                guild_id + 1 + index % channels_per_guild,
+                self.bot1.SERVER_CONFIGS[guild_id]["static_channel_id"],
+                self.admins[guild_id].id,
+                guild_id,
+                now - timedelta(minutes=lists - index),
+                event_at
+            ))
+
+        connection = await asyncpg.connect(self.bot1.db.database_url)
+        try:
+            await connection.copy_records_to_table(
+                "lists", records=list_rows,
+                columns=["id", "name", "channel_id", "static_channel_id", "created_by", "guild_id", "created_at", "event_at"]
+            )
+            pks = dict(await connection.fetch('SELECT id, pk FROM lists'))
+
+            participant_rows = []
+            rollback_rows = []
+            for list_id, _, _, _, _, guild_id, created_at, _ in list_rows:
+                guild = self.guilds[guild_id]
+                for position in range(participants):
+                    member = guild.add_member()
+                    has_rollback = position < rollbacks
+                    registered_at = created_at + timedelta(seconds=position)
+                    participant_rows.append((pks[list_id], member.id, member.display_name, has_rollback, registered_at))
+                    if has_rollback:
+                        text = " ".join(rng.choice(("атака", "защита", "флаг", "точка", "ротация", "таймер", "откат")) for _ in range(rng.randint(5, 25)))
+                        rollback_rows.append((pks[list_id], member.id, member.display_name, text, registered_at + timedelta(minutes=5)))
+
+            await connection.copy_records_to_table(
+                "participants", records=participant_rows,
+                columns=["list_pk", "user_id", "display_name", "has_rollback", "registered_at"]
+            )
+            await connection.copy_records_to_table(
+                "rollbacks", records=rollback_rows,
+                columns=["list_pk", "user_id", "user_name", "text", "timestamp"]
+            )
+        finally:
+            await connection.close()
+
+        self.list_ids = [row[0] for row in list_rows]
+        return guild_ids
+
+async def prime_renders(bot1, guild_ids):
+    # Первая отрисовка создает сообщения и сохраняет отпечатки, как у давно работающего бота.
+    await bot1.load_guild_lists(guild_ids)
+    for list_id in bot1.active_lists:
+        bot1.mark_dirty(list_id)
+    await flush_renders(bot1)
+
+async def flush_renders(bot1):
+    while bot1.dirty_lists:
+        pending = [(list_id, bot1.dirty_lists.pop(list_id)[2]) for list_id in list(bot1.dirty_lists)]
+        await asyncio.gather(*(bot1.render_list(list_id, priority) for list_id, priority in pending))
+
+def db_round_trips(bot1):
+    return sum(
+        histogram[2]
+        for (name, _), histogram in bot1.metrics.histograms.items()
+        if name == "rollback_db_query_seconds"
+    )
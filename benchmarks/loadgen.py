@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (
+    BENCH_SCHEMA, Dataset, DiscordRecorder, FakeInteraction, LocalPostgres,
+    drop_schema, load_bot, prime_renders, reset_schema, with_search_path
+)
+
+DEADLINE_SECONDS = 3.0
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None
+    }
+
+class LoadGenerator:
+    def __init__(self, bot1, recorder, dataset, args):
+        self.bot1 = bot1
+        self.recorder = recorder
+        self.dataset = dataset
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.hot_lists = dataset.list_ids[:max(args.hot_lists, 1)]
+        self.limit = asyncio.Semaphore(args.concurrency) if args.concurrency else None
+        self.markers = itertools.count()
+        self.tasks = set()
+        self.latencies = defaultdict(list)
+        self.missed = Counter()
+        self.unanswered = Counter()
+        self.errors = Counter()
+        self.pending_renders = {}
+        self.user_markers = {}
+        self.superseded = Counter()
+        self.render_lags = defaultdict(list)
+        recorder.message_listeners.append(self.message_changed)
+
+    def message_changed(self, message):
+        if not self.pending_renders:
+            return
+        text = message.content or ""
+        if message.embed is not None:
+            text += message.embed.description or ""
+        now = time.perf_counter()
+        for marker in [marker for marker in self.pending_renders if marker in text]:
+            kind, mutated_at = self.pending_renders.pop(marker)
+            self.render_lags[kind].append(now - mutated_at)
+
+    def interaction(self, list_id, author, action=None, text_values=None):
+        list_data = self.bot1.active_lists[list_id]
+        custom_id = self.bot1.button_custom_id(action, list_id) if action else None
+        return FakeInteraction(
+            self.recorder, self.dataset.guild_for(list_id), author, list_data["channel_id"],
+            text_values=text_values, custom_id=custom_id
+        )
+
+    async def handle(self, name, inter, call):
+        try:
+            if self.limit:
+                async with self.limit:
+                    await call()
+            else:
+                await call()
+        except Exception as e:
+            self.errors[name] += 1
+            print(f"❌ {name}: {e!r}", file=sys.stderr)
+
+        if inter.responded_at is None:
+            self.unanswered[name] += 1
+            self.missed[name] += 1
+            return False
+
+        latency = inter.responded_at - inter.created_at
+        self.latencies[name].append(latency)
+        if latency > DEADLINE_SECONDS:
+            self.missed[name] += 1
+        return True
+
+    async def press(self, list_id, author, action):
+        inter = self.interaction(list_id, author, action)
+        await self.handle(f"button:{action}", inter, lambda: self.bot1.dispatch_button(inter))
+        return inter
+
+    async def think(self, scale=1.0):
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_time * scale)
+
+    def pick_participant(self, list_id, with_rollback):
+        participants = self.bot1.active_lists[list_id]["participants"]
+        candidates = [user_id for user_id, info in participants.items() if info["has_rollback"] == with_rollback]
+        if not candidates:
+            return None
+        return self.dataset.guild_for(list_id).get_member(self.rng.choice(candidates))
+
+    def forget_marker(self, list_id, user_id):
+        pending = self.pending_renders.pop(self.user_markers.pop((list_id, user_id), None), None)
+        if pending is not None:
+            self.superseded[pending[0]] += 1
+
+    async def rollback_flow(self):
+        list_id = self.rng.choice(self.hot_lists)
+        participants = list(self.bot1.active_lists[list_id]["participants"])
+        if not participants:
+            return
+        author = self.dataset.guild_for(list_id).get_member(self.rng.choice(participants))
+
+        inter = await self.press(list_id, author, "open")
+        if inter.modal is None:
+            if not inter.messages or not inter.messages[-1].startswith("📝"):
+                return
+            await self.think()
+            inter = await self.press(list_id, author, "replace")
+            if inter.modal is None:
+                return
+
+        await self.think(scale=3)
+        marker = f"LG{next(self.markers):06d}"
+        modal = inter.modal
+        submit = self.interaction(list_id, author, text_values={"rollback_text": f"{marker} нагрузочный откат"})
+        await self.handle("modal:rollback", submit, lambda: modal.callback(submit))
+        if submit.messages and submit.messages[-1].startswith("✅"):
+            self.forget_marker(list_id, author.id)
+            self.pending_renders[marker] = ("rollback", time.perf_counter())
+            self.user_markers[(list_id, author.id)] = marker
+
+    async def delete_flow(self):
+        list_id = self.rng.choice(self.hot_lists)
+        author = self.pick_participant(list_id, True)
+        if author is None:
+            return
+
+        inter = await self.press(list_id, author, "open")
+        if not inter.messages or not inter.messages[-1].startswith("📝"):
+            return
+        await self.think()
+        await self.press(list_id, author, "delete")
+        await self.think()
+        inter = await self.press(list_id, author, "confirm_delete")
+        if inter.messages and inter.messages[-1].startswith("✅"):
+            self.forget_marker(list_id, author.id)
+
+    async def register_flow(self):
+        list_id = self.rng.choice(self.hot_lists)
+        guild = self.dataset.guild_for(list_id)
+        members = [guild.add_member() for _ in range(self.args.register_batch)]
+        inter = self.interaction(list_id, self.dataset.admins[guild.id])
+        mentions = " ".join(member.mention for member in members)
+        await self.handle(
+            "command:register_user", inter,
+            lambda: self.bot1.register_user.callback(inter, list_id=list_id, users=mentions)
+        )
+        if inter.messages and inter.messages[-1].startswith("✅"):
+            self.pending_renders[members[-1].mention] = ("register", time.perf_counter())
+
+    async def reset_flow(self):
+        list_id = self.rng.choice(self.hot_lists)
+        inter = self.interaction(list_id, self.dataset.admins[self.dataset.guild_for(list_id).id])
+        await self.handle(
+            "command:reset_rollbacks", inter,
+            lambda: self.bot1.reset_rollbacks.callback(inter, list_id=list_id)
+        )
+        if inter.messages and inter.messages[-1].startswith("✅"):
+            for key in [key for key in self.user_markers if key[0] == list_id]:
+                self.forget_marker(*key)
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def arrivals(self, rate, flow, deadline):
+        if rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                return
+            self.spawn(flow())
+
+    async def drain(self, timeout):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not self.tasks and not self.bot1.dirty_lists and not self.bot1.rendering_lists and not self.bot1.outbound.depth():
+                return
+            await asyncio.sleep(0.1)
+
+    async def run(self):
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(
+            self.arrivals(self.args.rollback_rate, self.rollback_flow, deadline),
+            self.arrivals(self.args.delete_rate, self.delete_flow, deadline),
+            self.arrivals(self.args.register_rate, self.register_flow, deadline),
+            self.arrivals(self.args.reset_rate, self.reset_flow, deadline)
+        )
+        await self.drain(self.args.drain_timeout)
+        elapsed = time.perf_counter() - started
+
+        handlers = sorted(set(self.latencies) | set(self.unanswered) | set(self.errors))
+        kinds = sorted(set(self.render_lags) | set(self.superseded) | {kind for kind, _ in self.pending_renders.values()})
+        unseen = Counter(kind for kind, _ in self.pending_renders.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "interactions": {
+                name: {
+                    **summarize(self.latencies[name]),
+                    "missed_deadline": self.missed[name],
+                    "unanswered": self.unanswered[name],
+                    "errors": self.errors[name]
+                }
+                for name in handlers
+            },
+            "missed_deadline_total": sum(self.missed.values()),
+            "render_lag": {
+                kind: {**summarize(self.render_lags[kind]), "unseen": unseen[kind], "superseded": self.superseded[kind]}
+                for kind in kinds
+            },
+            "outbound": dict(self.bot1.outbound.stats),
+            "discord_calls": dict(self.recorder.calls)
+        }
+
+async def run_load(args, database_url):
+    await reset_schema(database_url)
+    recorder = DiscordRecorder()
+    bot1 = load_bot(with_search_path(database_url, BENCH_SCHEMA), recorder)
+    try:
+        await bot1.db.connect()
+        dataset = Dataset(bot1, recorder)
+        guild_ids = await dataset.seed(args.lists, args.participants, args.rollbacks, args.guilds, seed=args.seed)
+        await prime_renders(bot1, guild_ids)
+
+        recorder.latency = args.discord_latency
+        bot1.render_task = asyncio.create_task(bot1.render_worker())
+        print(f"🚦 Нагрузка {args.duration} сек на {args.hot_lists} списков...", file=sys.stderr)
+        results = await LoadGenerator(bot1, recorder, dataset, args).run()
+        bot1.render_task.cancel()
+    finally:
+        if bot1.db.pool is not None:
+            await bot1.db.pool.close()
+        if not args.keep_data:
+            await drop_schema(database_url)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "duration", "rollback_rate", "delete_rate", "register_rate", "register_batch", "reset_rate",
+                "concurrency", "think_time", "discord_latency", "hot_lists", "lists", "participants", "rollbacks", "seed"
+            )
+        },
+        "settings": {
+            "render_debounce_seconds": bot1.RENDER_DEBOUNCE_SECONDS,
+            "render_max_latency_seconds": bot1.RENDER_MAX_LATENCY_SECONDS,
+            "channel_rate_limit": bot1.CHANNEL_RATE_LIMIT,
+            "channel_rate_period": bot1.CHANNEL_RATE_PERIOD,
+            "outbound_concurrency": bot1.OUTBOUND_CONCURRENCY
+        },
+        **results
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный генератор для обработчиков бота откатов")
+    parser.add_argument("--duration", type=float, default=60, help="длительность подачи нагрузки, сек")
+    parser.add_argument("--rollback-rate", type=float, default=5, help="нажатий «Отправить откат» в секунду")
+    parser.add_argument("--delete-rate", type=float, default=0.5, help="удалений отката в секунду")
+    parser.add_argument("--register-rate", type=float, default=0.2, help="вызовов /register_user в секунду")
+    parser.add_argument("--register-batch", type=int, default=10, help="пользователей в одном /register_user")
+    parser.add_argument("--reset-rate", type=float, default=0.02, help="вызовов /reset_rollbacks в секунду")
+    parser.add_argument("--concurrency", type=int, default=0, help="максимум одновременно обрабатываемых взаимодействий (0 — без ограничения)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="пауза пользователя между шагами, сек")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="задержка каждого вызова Discord, сек")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="сколько ждать завершения отрисовок после нагрузки, сек")
+    parser.add_argument("--hot-lists", type=int, default=3, help="сколько списков получают нагрузку")
+    parser.add_argument("--lists", type=int, default=20, help="количество списков")
+    parser.add_argument("--participants", type=int, default=60, help="участников в каждом списке")
+    parser.add_argument("--rollbacks", type=int, default=10, help="откатов в каждом списке до начала нагрузки")
+    parser.add_argument("--guilds", type=int, default=None, help="сколько серверов из SERVER_CONFIGS использовать")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="существующий Postgres вместо временного; данные пишутся в схему rollback_bench")
+    parser.add_argument("--pg-bin", help="каталог с initdb и pg_ctl, если их нет в PATH")
+    parser.add_argument("--keep-data", action="store_true", help="не удалять схему rollback_bench после прогона")
+    parser.add_argument("--output", help="файл для JSON-результатов (по умолчанию stdout)")
+    args = parser.parse_args()
+    args.rollbacks = min(args.rollbacks, args.participants)
+    return args
+
+def main():
+    args = parse_args()
+    postgres = None
+    database_url = args.database_url
+    if not database_url:
+        postgres = LocalPostgres(args.pg_bin)
+        database_url = postgres.start()
+
+    try:
+        report = asyncio.run(run_load(args, database_url))
+    finally:
+        if postgres is not None:
+            postgres.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
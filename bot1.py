@@ -10,11 +10,67 @@ import random
 import string
 import asyncpg
 import asyncio
+import time
+import hashlib
+import csv
+import tempfile
+import socket
+import logging
+import contextlib
+import functools
+import bisect
+from datetime import timedelta
+from datetime import timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from aiohttp import web
+
+LOG_LEVEL = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+def log_context(**fields):
+    return {"fields": fields}
+
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_handler.setLevel(LOG_LEVEL)
+logging.basicConfig(level=LOG_LEVEL, handlers=[log_handler])
+logger = logging.getLogger("rollback_bot")
 
 intents = disnake.Intents.default()
 intents.members = True
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+def parse_shard_ids(value):
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids or None
+
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS', ''))
+INSTANCE_ID = os.getenv('INSTANCE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        help_command=None,
+        shard_count=SHARD_COUNT,
+        shard_ids=SHARD_IDS
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
 
 SERVER_CONFIGS = {
     1429544000188317831: {
@@ -27,9 +83,320 @@ SERVER_CONFIGS = {
     }
 }
 
+MIGRATION_LOCK_ID = 715_310_001
+
+MIGRATIONS = [
+    (1, "базовая схема", '''
+        CREATE TABLE IF NOT EXISTS lists (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            static_channel_id BIGINT NOT NULL,
+            created_by TEXT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW(),
+            message_id BIGINT,
+            status_message_id BIGINT
+        );
+        
+        CREATE TABLE IF NOT EXISTS participants (
+            user_id TEXT NOT NULL,
+            list_id TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            has_rollback BOOLEAN DEFAULT FALSE,
+            registered_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (user_id, list_id),
+            FOREIGN KEY (list_id) REFERENCES lists(id) ON DELETE CASCADE
+        );
+        
+        CREATE TABLE IF NOT EXISTS rollbacks (
+            timestamp TIMESTAMP DEFAULT NOW(),
+            user_id TEXT NOT NULL,
+            list_id TEXT NOT NULL,
+            user_name TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (user_id, list_id),
+            FOREIGN KEY (list_id) REFERENCES lists(id) ON DELETE CASCADE
+        );
+        
+        ALTER TABLE lists ADD COLUMN IF NOT EXISTS status_fingerprint TEXT;
+        ALTER TABLE lists ADD COLUMN IF NOT EXISTS status_message_ids BIGINT[] NOT NULL DEFAULT '{}';
+        ALTER TABLE lists ADD COLUMN IF NOT EXISTS status_fingerprints TEXT[] NOT NULL DEFAULT '{}';
+        
+        UPDATE lists
+        SET status_message_ids = ARRAY[status_message_id],
+            status_fingerprints = ARRAY[COALESCE(status_fingerprint, '')]
+        WHERE status_message_id IS NOT NULL;
+    '''),
+    (2, "BIGINT для идентификаторов пользователей", '''
+        ALTER TABLE lists ALTER COLUMN created_by TYPE BIGINT USING created_by::BIGINT;
+        ALTER TABLE participants ALTER COLUMN user_id TYPE BIGINT USING user_id::BIGINT;
+        ALTER TABLE rollbacks ALTER COLUMN user_id TYPE BIGINT USING user_id::BIGINT;
+        ALTER TABLE lists DROP COLUMN status_message_id, DROP COLUMN status_fingerprint;
+    '''),
+    (3, "целочисленный суррогатный ключ списков", '''
+        ALTER TABLE lists ADD COLUMN pk INTEGER GENERATED BY DEFAULT AS IDENTITY;
+        
+        ALTER TABLE participants ADD COLUMN list_pk INTEGER;
+        UPDATE participants p SET list_pk = l.pk FROM lists l WHERE l.id = p.list_id;
+        ALTER TABLE participants DROP COLUMN list_id;
+        
+        ALTER TABLE rollbacks ADD COLUMN list_pk INTEGER;
+        UPDATE rollbacks r SET list_pk = l.pk FROM lists l WHERE l.id = r.list_id;
+        ALTER TABLE rollbacks DROP COLUMN list_id;
+        
+        ALTER TABLE lists DROP CONSTRAINT lists_pkey;
+        ALTER TABLE lists ADD PRIMARY KEY (pk);
+        ALTER TABLE lists ADD CONSTRAINT lists_id_key UNIQUE (id);
+        
+        ALTER TABLE participants ALTER COLUMN list_pk SET NOT NULL;
+        ALTER TABLE participants ADD PRIMARY KEY (list_pk, user_id);
+        ALTER TABLE participants ADD FOREIGN KEY (list_pk) REFERENCES lists(pk) ON DELETE CASCADE;
+        
+        ALTER TABLE rollbacks ALTER COLUMN list_pk SET NOT NULL;
+        ALTER TABLE rollbacks ADD PRIMARY KEY (list_pk, user_id);
+        ALTER TABLE rollbacks ADD FOREIGN KEY (list_pk) REFERENCES lists(pk) ON DELETE CASCADE;
+    '''),
+    (4, "индексы для выборок по серверу и дате", '''
+        CREATE INDEX IF NOT EXISTS lists_guild_created_idx ON lists (guild_id, created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS lists_created_at_idx ON lists (created_at);
+    '''),
+    (5, "отпечаток сообщения с кнопками", '''
+        ALTER TABLE lists ADD COLUMN participants_fingerprint TEXT;
+    '''),
+    (6, "координация нескольких экземпляров бота", '''
+        CREATE TABLE bot_instances (
+            instance_id TEXT PRIMARY KEY,
+            shard_count INTEGER NOT NULL,
+            shard_ids INTEGER[] NOT NULL,
+            heartbeat_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        
+        CREATE TABLE worker_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        );
+    '''),
+    (7, "уведомления об изменениях списков", '''
+        CREATE OR REPLACE FUNCTION notify_list_change() RETURNS trigger AS $$
+        DECLARE
+            changed RECORD;
+            payload TEXT;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := OLD;
+            ELSE
+                changed := NEW;
+            END IF;
+            
+            IF TG_TABLE_NAME = 'lists' THEN
+                payload := json_build_object('list_pk', changed.pk, 'guild_id', changed.guild_id, 'version', txid_current())::text;
+            ELSE
+                payload := json_build_object('list_pk', changed.list_pk, 'guild_id', NULL, 'version', txid_current())::text;
+            END IF;
+            
+            PERFORM pg_notify('list_changes', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        CREATE TRIGGER lists_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON lists
+            FOR EACH ROW EXECUTE FUNCTION notify_list_change();
+        CREATE TRIGGER participants_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON participants
+            FOR EACH ROW EXECUTE FUNCTION notify_list_change();
+        CREATE TRIGGER rollbacks_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON rollbacks
+            FOR EACH ROW EXECUTE FUNCTION notify_list_change();
+    '''),
+    (8, "время события и архив списков", '''
+        ALTER TABLE lists ADD COLUMN event_at TIMESTAMP;
+        ALTER TABLE lists ADD COLUMN archived_at TIMESTAMP;
+        
+        -- Время события раньше хранилось только в названии: "18:00 | 25.10.2025 | ..."
+        DO $$
+        DECLARE
+            item RECORD;
+        BEGIN
+            FOR item IN
+                SELECT pk,
+                    substring(name from '^ *([0-9]{1,2}:[0-9]{2}) *[|]') AS time_part,
+                    substring(name from '^[^|]*[|] *([0-9]{1,2}[.][0-9]{1,2}[.][0-9]{4}) *[|]') AS date_part
+                FROM lists
+            LOOP
+                CONTINUE WHEN item.time_part IS NULL OR item.date_part IS NULL;
+                BEGIN
+                    UPDATE lists
+                    SET event_at = to_timestamp(item.date_part || ' ' || item.time_part, 'DD.MM.YYYY HH24:MI')::timestamp
+                    WHERE pk = item.pk;
+                EXCEPTION WHEN others THEN
+                    NULL;
+                END;
+            END LOOP;
+        END $$;
+        
+        CREATE INDEX lists_unarchived_event_idx ON lists ((COALESCE(event_at, created_at))) WHERE archived_at IS NULL;
+    '''),
+    (9, "полнотекстовый поиск по откатам", '''
+        -- russian находит словоформы, simple - ники, названия и слова на латинице без стемминга.
+        ALTER TABLE rollbacks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            to_tsvector('russian', text) || to_tsvector('simple', text)
+        ) STORED;
+        
+        CREATE INDEX rollbacks_search_idx ON rollbacks USING GIN (search_vector);
+    '''),
+]
+
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+class Metrics:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.families = {}
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+    
+    def register(self, name, kind, help_text, collect=None):
+        self.families[name] = (kind, help_text)
+        if collect is not None:
+            self.collectors[name] = collect
+    
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+    
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+    
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def render(self):
+        lines = []
+        for name, (kind, help_text) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            
+            if name in self.collectors:
+                try:
+                    lines.append(f"{name} {self.collectors[name]()}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось собрать метрику {name}: {e}")
+            elif kind == "histogram":
+                for (metric, labels), (counts, total, count) in self.histograms.items():
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+            else:
+                for (metric, labels), value in self.counters.items():
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.register("rollback_db_query_seconds", "histogram", "Время выполнения запросов к базе")
+metrics.register("rollback_db_pool_wait_seconds", "histogram", "Ожидание свободного соединения в пуле")
+metrics.register("rollback_db_errors_total", "counter", "Запросы к базе, завершившиеся ошибкой")
+metrics.register("rollback_db_pool_size", "gauge", "Открытые соединения пула", lambda: db.pool.get_size() if db.pool else 0)
+metrics.register("rollback_db_pool_idle", "gauge", "Свободные соединения пула", lambda: db.pool.get_idle_size() if db.pool else 0)
+metrics.register("rollback_discord_request_seconds", "histogram", "Время запросов к REST API Discord")
+metrics.register("rollback_discord_rate_limited_total", "counter", "Ответы 429 от Discord")
+metrics.register("rollback_discord_global_rate_limited_total", "counter", "Ответы 429 от Discord с глобальным лимитом")
+metrics.register("rollback_outbound_wait_seconds", "histogram", "Время ожидания запроса в исходящей очереди")
+metrics.register("rollback_outbound_queue_depth", "gauge", "Запросы в исходящей очереди", lambda: outbound.depth())
+metrics.register("rollback_render_seconds", "histogram", "Время отрисовки сообщений списка")
+metrics.register("rollback_render_errors_total", "counter", "Ошибки отрисовки списков")
+metrics.register("rollback_dirty_lists", "gauge", "Списки, ожидающие отрисовки", lambda: len(dirty_lists))
+metrics.register("rollback_active_lists", "gauge", "Списки в кэше", lambda: len(active_lists))
+metrics.register("rollback_handler_seconds", "histogram", "Время обработки команд, кнопок и форм")
+metrics.register("rollback_db_available", "gauge", "База данных доступна (0 - режим только для чтения)", lambda: int(db.available))
+metrics.register("rollback_db_reconnects_total", "counter", "Пересоздания пула соединений")
+
+class RateLimitCounter(logging.Handler):
+    # На глобальный 429 disnake пишет оба предупреждения: общий счетчик
+    # считает только первое, а глобальные лимиты учитываются отдельно.
+    def emit(self, record):
+        if not isinstance(record.msg, str) or record.levelno < logging.WARNING:
+            return
+        if record.msg.startswith("We are being rate limited"):
+            metrics.inc("rollback_discord_rate_limited_total")
+        elif record.msg.startswith("Global rate limit has been hit"):
+            metrics.inc("rollback_discord_global_rate_limited_total")
+
+rate_limit_logger = logging.getLogger("disnake.http")
+rate_limit_logger.addHandler(RateLimitCounter())
+rate_limit_logger.setLevel(min(LOG_LEVEL, logging.WARNING))
+
+def query_label(query):
+    return " ".join(query.split())[:80]
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', '60'))
+DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', '10'))
+DB_HEALTH_CHECK_SECONDS = int(os.getenv('DB_HEALTH_CHECK_SECONDS', '15'))
+DB_FAILURE_THRESHOLD = int(os.getenv('DB_FAILURE_THRESHOLD', '3'))
+DB_RECONNECT_MAX_SECONDS = int(os.getenv('DB_RECONNECT_MAX_SECONDS', '60'))
+
+# Ошибки соединения, а не самого запроса: по ним считается доступность базы.
+DB_CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.CrashShutdownError
+)
+
+class DatabaseUnavailable(Exception):
+    pass
+
+# Запрос не уложился в DB_COMMAND_TIMEOUT: соединение живо, поэтому
+# такие ошибки не приближают переход в режим только для чтения.
+class DatabaseTimeout(DatabaseUnavailable):
+    pass
+
 class Database:
     def __init__(self):
         self.pool = None
+        self.database_url = None
+        self.backend_pids = set()
+        self.ready = asyncio.Event()
+        self.failures = 0
+        self.recovery_task = None
+    
+    @property
+    def available(self):
+        return self.ready.is_set()
     
     async def get_database_url(self):
         database_url = os.getenv('DATABASE_URL')
@@ -51,67 +418,172 @@ class Database:
         if database_url.startswith('postgres://'):
             database_url = database_url.replace('postgres://', 'postgresql://', 1)
         
+        self.database_url = database_url
+        
         try:
-            self.pool = await asyncpg.create_pool(
-                database_url,
-                min_size=1,
-                max_size=10,
-                command_timeout=60
-            )
+            self.pool = await self.create_pool()
             await self.init_tables()
-            print("✅ Подключение к базе данных установлено")
+            self.ready.set()
+            logger.info("✅ Подключение к базе данных установлено")
         except Exception as e:
-            print(f"❌ Ошибка подключения к базе: {e}")
+            logger.error(f"❌ Ошибка подключения к базе: {e}")
             raise
     
+    async def create_pool(self):
+        return await asyncpg.create_pool(
+            self.database_url,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            timeout=DB_CONNECT_TIMEOUT,
+            init=self.init_connection
+        )
+    
+    async def check_health(self):
+        async with self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            await conn.fetchval('SELECT 1', timeout=DB_CONNECT_TIMEOUT)
+    
+    def ensure_available(self):
+        if not self.available:
+            raise DatabaseUnavailable("база данных недоступна")
+    
+    def record_failure(self, error):
+        self.failures += 1
+        if self.available and self.failures >= DB_FAILURE_THRESHOLD:
+            self.ready.clear()
+            logger.error(f"❌ База данных недоступна, бот переходит в режим только для чтения: {error}")
+            self.recovery_task = asyncio.create_task(self.recover())
+    
+    def handle_error(self, error, acquired):
+        # Таймаут после получения соединения - это command_timeout медленного
+        # запроса; таймаут при получении соединения и сетевые ошибки - сбой базы.
+        if acquired and isinstance(error, asyncio.TimeoutError):
+            raise DatabaseTimeout(str(error) or "превышено время выполнения запроса") from error
+        self.record_failure(error)
+        raise DatabaseUnavailable(str(error)) from error
+    
+    async def recover(self):
+        delay = 1
+        while True:
+            await asyncio.sleep(delay + random.random() * delay)
+            try:
+                try:
+                    await self.check_health()
+                except Exception:
+                    # Пул мог остаться с мертвыми соединениями: создаем новый и закрываем старый.
+                    old_pool, self.pool = self.pool, await self.create_pool()
+                    metrics.inc("rollback_db_reconnects_total")
+                    if old_pool is not None:
+                        old_pool.terminate()
+                    await self.check_health()
+            except Exception as e:
+                delay = min(delay * 2, DB_RECONNECT_MAX_SECONDS)
+                logger.warning(f"⏳ База данных все еще недоступна, повтор через ~{delay} сек: {e}")
+                continue
+            
+            self.failures = 0
+            self.ready.set()
+            logger.info("✅ Подключение к базе данных восстановлено")
+            return
+    
+    async def init_connection(self, conn):
+        pid = conn.get_server_pid()
+        self.backend_pids.add(pid)
+        conn.add_termination_listener(lambda _: self.backend_pids.discard(pid))
+    
+    async def run_query(self, method, query, args):
+        self.ensure_available()
+        label = query_label(query)
+        started = time.perf_counter()
+        acquired = None
+        try:
+            async with self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+                acquired = time.perf_counter()
+                metrics.observe("rollback_db_pool_wait_seconds", acquired - started)
+                try:
+                    result = await getattr(conn, method)(query, *args)
+                except Exception:
+                    metrics.inc("rollback_db_errors_total", query=label)
+                    raise
+                finally:
+                    metrics.observe("rollback_db_query_seconds", time.perf_counter() - acquired, query=label)
+        except DB_CONNECTION_ERRORS as e:
+            self.handle_error(e, acquired is not None)
+        
+        self.failures = 0
+        return result
+    
+    async def fetch(self, query, *args):
+        return await self.run_query("fetch", query, args)
+    
+    async def fetchrow(self, query, *args):
+        return await self.run_query("fetchrow", query, args)
+    
+    async def fetchval(self, query, *args):
+        return await self.run_query("fetchval", query, args)
+    
+    async def execute(self, query, *args):
+        return await self.run_query("execute", query, args)
+    
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self.ensure_available()
+        started = time.perf_counter()
+        acquired = False
+        pid = None
+        try:
+            async with self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+                acquired = True
+                pid = conn.get_server_pid()
+                metrics.observe("rollback_db_pool_wait_seconds", time.perf_counter() - started)
+                async with conn.transaction():
+                    yield conn
+        except DB_CONNECTION_ERRORS as e:
+            self.handle_error(e, acquired)
+        except asyncpg.exceptions.InterfaceError as e:
+            # Если соединение оборвалось посреди транзакции, пул отцепляет его,
+            # и вызовы в теле падают с InterfaceError, а не с ошибкой соединения.
+            if pid is None or pid in self.backend_pids:
+                raise
+            self.handle_error(e, False)
+        
+        self.failures = 0
+    
     async def init_tables(self):
         try:
-            await self.pool.execute('''
-                CREATE TABLE IF NOT EXISTS lists (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    channel_id BIGINT NOT NULL,
-                    static_channel_id BIGINT NOT NULL,
-                    created_by TEXT NOT NULL,
-                    guild_id BIGINT NOT NULL,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    message_id BIGINT,
-                    status_message_id BIGINT
-                )
-            ''')
-            
-            await self.pool.execute('''
-                CREATE TABLE IF NOT EXISTS participants (
-                    user_id TEXT NOT NULL,
-                    list_id TEXT NOT NULL,
-                    display_name TEXT NOT NULL,
-                    has_rollback BOOLEAN DEFAULT FALSE,
-                    registered_at TIMESTAMP DEFAULT NOW(),
-                    PRIMARY KEY (user_id, list_id),
-                    FOREIGN KEY (list_id) REFERENCES lists(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            await self.pool.execute('''
-                CREATE TABLE IF NOT EXISTS rollbacks (
-                    timestamp TIMESTAMP DEFAULT NOW(),
-                    user_id TEXT NOT NULL,
-                    list_id TEXT NOT NULL,
-                    user_name TEXT NOT NULL,
-                    text TEXT NOT NULL,
-                    PRIMARY KEY (user_id, list_id),
-                    FOREIGN KEY (list_id) REFERENCES lists(id) ON DELETE CASCADE
-                )
-            ''')
+            async with self.pool.acquire() as conn:
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT NOW()
+                    )
+                ''')
+                
+                for version, description, sql in MIGRATIONS:
+                    async with conn.transaction():
+                        await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+                        
+                        applied = await conn.fetchval('SELECT 1 FROM schema_version WHERE version = $1', version)
+                        if applied:
+                            continue
+                        
+                        await conn.execute(sql)
+                        await conn.execute('''
+                            INSERT INTO schema_version (version, description) VALUES ($1, $2)
+                        ''', version, description)
+                        logger.info(f"✅ Применена миграция {version}: {description}")
             
-            print("✅ Таблицы инициализированы")
+            logger.info("✅ Таблицы инициализированы")
         except Exception as e:
-            print(f"❌ Ошибка инициализации таблиц: {e}")
+            logger.error(f"❌ Ошибка инициализации таблиц: {e}")
             raise
 
 db = Database()
 
 active_lists = {}
+render_fingerprints = {}
 
 def get_server_config(guild_id):
     return SERVER_CONFIGS.get(guild_id)
@@ -141,96 +613,517 @@ def is_admin(member):
 def generate_list_id():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
 
-async def create_new_list(list_id, list_name, channel_id, created_by, guild_id):
+EVENT_TIMEZONE = os.getenv('EVENT_TIMEZONE', 'Europe/Moscow')
+
+try:
+    event_timezone = ZoneInfo(EVENT_TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    logger.warning(f"⚠️ Неизвестный часовой пояс {EVENT_TIMEZONE}, время событий считается в UTC")
+    EVENT_TIMEZONE = "UTC"
+    event_timezone = timezone.utc
+
+EVENT_TIME_RE = re.compile(r'^(\d{1,2})[:.\-](\d{2})$')
+EVENT_DATE_RE = re.compile(r'^(\d{1,2})[./\-](\d{1,2})(?:[./\-](\d{4}|\d{2}))?$')
+
+# Время события хранится без часового пояса, в поясе EVENT_TIMEZONE, как его вводят администраторы.
+def event_now():
+    return datetime.now(event_timezone).replace(tzinfo=None)
+
+# Колонки с DEFAULT NOW() идут по часам базы; время в поясе события
+# переводится в них на стороне SQL, чтобы не зависеть от пояса сервера.
+def event_to_db_clock(placeholder):
+    return f"({placeholder}::timestamp AT TIME ZONE '{EVENT_TIMEZONE}')::timestamp"
+
+def db_to_event_clock(column):
+    return f"({column}::timestamptz AT TIME ZONE '{EVENT_TIMEZONE}')"
+
+def parse_event_time(date_value, time_value, now=None):
+    time_match = EVENT_TIME_RE.match(time_value.strip())
+    date_match = EVENT_DATE_RE.match(date_value.strip())
+    if not time_match or not date_match:
+        return None
+    
+    now = now or event_now()
+    day, month, year = date_match.groups()
+    if year:
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+    
+    try:
+        event_at = datetime(year or now.year, int(month), int(day), int(time_match[1]), int(time_match[2]))
+        if not year and event_at < now - timedelta(days=1):
+            event_at = event_at.replace(year=now.year + 1)
+    except ValueError:
+        return None
+    
+    return event_at
+
+def parse_period_date(value):
+    period_date = parse_event_time(value, "00:00")
+    # Для периодов дата без года означает прошедший день, а не ближайший будущий.
+    if period_date and not EVENT_DATE_RE.match(value.strip())[3] and period_date > event_now():
+        try:
+            period_date = period_date.replace(year=period_date.year - 1)
+        except ValueError:
+            return None
+    return period_date
+
+async def create_new_list(list_id, list_name, channel_id, created_by, guild_id, event_at=None):
     config = get_server_config(guild_id)
     static_channel_id = config["static_channel_id"] if config else channel_id
     
-    await db.pool.execute('''
-        INSERT INTO lists (id, name, channel_id, static_channel_id, created_by, guild_id)
-        VALUES ($1, $2, $3, $4, $5, $6)
-    ''', list_id, list_name, channel_id, static_channel_id, created_by, guild_id)
+    row = await db.fetchrow('''
+        INSERT INTO lists (id, name, channel_id, static_channel_id, created_by, guild_id, event_at)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        RETURNING pk, created_at
+    ''', list_id, list_name, channel_id, static_channel_id, created_by, guild_id, event_at)
     
     list_data = {
+        "pk": row['pk'],
         "id": list_id,
         "name": list_name,
         "channel_id": channel_id,
         "static_channel_id": static_channel_id,
         "created_by": created_by,
         "guild_id": guild_id,
+        "created_at": row['created_at'].isoformat(),
+        "event_at": event_at.isoformat() if event_at else None,
+        "archived_at": None,
+        "message_id": None,
+        "status_message_ids": [],
         "participants": {},
-        "rollbacks": {}
+        "rollbacks": {},
+        "version": 1,
+        "snapshot": None
     }
     
     active_lists[list_id] = list_data
+    index_list(list_data)
     
     return list_data
 
-async def get_list(list_id, guild_id, update_active=True):
-    row = await db.pool.fetchrow('''
-        SELECT * FROM lists WHERE id = $1 AND guild_id = $2
-    ''', list_id, guild_id)
-    
-    if not row:
-        if list_id in active_lists:
-            del active_lists[list_id]
-        return None
-    
-    participants_rows = await db.pool.fetch('''
-        SELECT * FROM participants WHERE list_id = $1
-    ''', list_id)
-    
+def touch_list(list_data):
+    list_data["version"] = list_data.get("version", 0) + 1
+
+def cache_list(list_data):
+    cached = active_lists.get(list_data["id"])
+    if cached is None:
+        active_lists[list_data["id"]] = list_data
+        return list_data
+    
+    # Перезагруженный список вливается в тот же словарь: обработчики, которые
+    # уже получили его через get_list, продолжают работать с актуальными данными.
+    version = cached["version"]
+    cached.clear()
+    cached.update(list_data)
+    cached["version"] = version
+    touch_list(cached)
+    return cached
+
+# Запросы гидратации выполняются через db.fetch: asyncpg подготавливает
+# их один раз на соединение и дальше берет из кэша подготовленных выражений.
+LIST_HYDRATION_SQL = '''
+    SELECT l.*,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'user_id', p.user_id,
+                'display_name', p.display_name,
+                'has_rollback', p.has_rollback,
+                'registered_at', p.registered_at
+            ))
+            FROM participants p WHERE p.list_pk = l.pk
+        ), '[]') AS participants_json,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'user_id', r.user_id,
+                'user_name', r.user_name,
+                'text', r.text,
+                'timestamp', r.timestamp
+            ))
+            FROM rollbacks r WHERE r.list_pk = l.pk
+        ), '[]') AS rollbacks_json,
+        txid_current_snapshot()::text AS snapshot
+    FROM lists l
+'''
+
+def snapshot_covers(snapshot, txids):
+    # Снимок вида "xmin:xmax:xip,...": транзакция видна, если она старше xmin
+    # или меньше xmax и не числится среди активных.
+    if not snapshot:
+        return False
+    xmin, xmax, xip = snapshot.split(":")
+    xmin, xmax = int(xmin), int(xmax)
+    active = {int(txid) for txid in xip.split(",") if txid}
+    return all(txid < xmin or (txid < xmax and txid not in active) for txid in txids)
+
+def normalize_timestamp(value):
+    return datetime.fromisoformat(value).isoformat()
+
+def list_from_row(row):
     participants = {}
-    for p in participants_rows:
+    for p in json.loads(row['participants_json']):
         participants[p['user_id']] = {
             "display_name": p['display_name'],
             "has_rollback": p['has_rollback'],
-            "registered_at": p['registered_at'].isoformat()
+            "registered_at": normalize_timestamp(p['registered_at'])
         }
     
-    rollbacks_rows = await db.pool.fetch('''
-        SELECT * FROM rollbacks WHERE list_id = $1
-    ''', list_id)
-    
     rollbacks = {}
-    for r in rollbacks_rows:
-        rollbacks[r['timestamp'].isoformat()] = {
+    for r in json.loads(row['rollbacks_json']):
+        rollbacks[r['user_id']] = {
             "user_id": r['user_id'],
             "user_name": r['user_name'],
             "text": r['text'],
-            "timestamp": r['timestamp'].isoformat()
+            "timestamp": normalize_timestamp(r['timestamp'])
         }
     
-    list_data = {
-        "id": row['id'],
+    list_id = row['id']
+    if row['archived_at'] is None:
+        if row['status_fingerprints'] and (list_id, "status") not in render_fingerprints:
+            render_fingerprints[(list_id, "status")] = list(row['status_fingerprints'])
+        if row['participants_fingerprint'] and (list_id, "participants") not in render_fingerprints:
+            render_fingerprints[(list_id, "participants")] = row['participants_fingerprint']
+    
+    return {
+        "pk": row['pk'],
+        "id": list_id,
         "name": row['name'],
         "channel_id": row['channel_id'],
         "static_channel_id": row['static_channel_id'],
         "created_by": row['created_by'],
         "guild_id": row['guild_id'],
         "created_at": row['created_at'].isoformat(),
+        "event_at": row['event_at'].isoformat() if row['event_at'] else None,
+        "archived_at": row['archived_at'].isoformat() if row['archived_at'] else None,
         "message_id": row['message_id'],
-        "status_message_id": row['status_message_id'],
+        "status_message_ids": list(row['status_message_ids']),
         "participants": participants,
-        "rollbacks": rollbacks
+        "rollbacks": rollbacks,
+        "version": 1,
+        "snapshot": row['snapshot']
     }
+
+async def get_list(list_id, guild_id, update_active=True, refresh=False):
+    if not refresh:
+        cached = active_lists.get(list_id)
+        if cached is not None:
+            if cached["guild_id"] != guild_id:
+                return None
+            return cached
+    
+    row = await db.fetchrow(
+        LIST_HYDRATION_SQL + 'WHERE l.id = $1 AND l.guild_id = $2',
+        list_id, guild_id
+    )
+    
+    if not row:
+        if list_id in active_lists:
+            del active_lists[list_id]
+            list_index.remove(list_id)
+        return None
+    
+    list_data = list_from_row(row)
     
     if update_active:
-        active_lists[list_id] = list_data
+        index_list(list_data)
+        if list_data["archived_at"]:
+            evict_list(list_id)
+        else:
+            list_data = cache_list(list_data)
     
     return list_data
 
-async def remove_user_rollback(list_data, user_id):
-    await db.pool.execute('''
-        DELETE FROM rollbacks WHERE list_id = $1 AND user_id = $2
-    ''', list_data["id"], user_id)
+async def load_lists(list_ids, update_active=True, expected_versions=None):
+    rows = await db.fetch(
+        LIST_HYDRATION_SQL + 'WHERE l.id = ANY($1::text[])',
+        list(list_ids)
+    )
     
-    await db.pool.execute('''
-        UPDATE participants SET has_rollback = FALSE 
-        WHERE list_id = $1 AND user_id = $2
-    ''', list_data["id"], user_id)
+    loaded = store_loaded_lists(rows, update_active, expected_versions)
+    
+    if update_active:
+        for list_id in list_ids:
+            if list_id not in loaded:
+                active_lists.pop(list_id, None)
+                list_index.remove(list_id)
+    
+    return loaded
+
+async def load_guild_lists(guild_ids, update_active=True):
+    rows = await db.fetch(
+        LIST_HYDRATION_SQL + 'WHERE l.guild_id = ANY($1::bigint[]) AND l.archived_at IS NULL',
+        list(guild_ids)
+    )
+    
+    return store_loaded_lists(rows, update_active)
+
+def store_loaded_lists(rows, update_active, expected_versions=None):
+    loaded = {}
+    for row in rows:
+        if expected_versions and row['id'] in expected_versions:
+            cached = active_lists.get(row['id'])
+            if cached is not None and cached["version"] != expected_versions[row['id']]:
+                # Пока шел запрос, список изменили локально: строка может быть
+                # старее кэша, поэтому она пропускается (None в результате).
+                loaded[row['id']] = None
+                continue
+        
+        list_data = list_from_row(row)
+        if update_active:
+            index_list(list_data)
+            if list_data["archived_at"]:
+                evict_list(list_data["id"])
+            else:
+                list_data = cache_list(list_data)
+        loaded[list_data["id"]] = list_data
+    
+    return loaded
+
+def evict_list(list_id):
+    active_lists.pop(list_id, None)
+    dirty_lists.pop(list_id, None)
+    refreshed_at.pop(list_id, None)
+    render_fingerprints.pop((list_id, "participants"), None)
+    render_fingerprints.pop((list_id, "status"), None)
+
+def is_archived(list_data):
+    return bool(list_data.get("archived_at"))
+
+ARCHIVED_LIST_MESSAGE = "🗄 Этот список в архиве: изменения больше не принимаются."
+DATABASE_UNAVAILABLE_MESSAGE = (
+    "⚠️ База данных временно недоступна: изменения сейчас не сохраняются. "
+    "Списки можно просматривать, а изменения повторите через минуту."
+)
+DATABASE_TIMEOUT_MESSAGE = "⏳ База данных не ответила вовремя. Повторите через минуту."
+
+async def reply_if_database_unavailable(inter, error):
+    if not isinstance(error, DatabaseUnavailable):
+        return False
     
+    message = DATABASE_TIMEOUT_MESSAGE if isinstance(error, DatabaseTimeout) else DATABASE_UNAVAILABLE_MESSAGE
+    if inter.response.is_done():
+        await inter.followup.send(message, ephemeral=True)
+    else:
+        await inter.response.send_message(message, ephemeral=True)
     return True
 
+LIST_INDEX_TOKEN_LENGTH = 20
+LIST_INDEX_WORD_RE = re.compile(r'\w+')
+
+# Индекс для автодополнения ID списков: по каждому серверу списки упорядочены
+# по времени события, а префиксы ID и слов названия ведут к своим спискам.
+class ListIndex:
+    def __init__(self):
+        self.entries = {}
+        self.ordered = {}
+        self.prefixes = {}
+        self.by_pk = {}
+    
+    def tokens(self, list_id, name):
+        return [list_id.lower()] + LIST_INDEX_WORD_RE.findall(name.lower())
+    
+    def sort_key(self, event_at, archived, list_id):
+        # Сначала идущие и предстоящие события, затем архив от свежих к старым.
+        timestamp = event_at.timestamp()
+        return (archived, -timestamp if archived else timestamp, list_id)
+    
+    def add(self, guild_id, list_id, pk, name, event_at, archived):
+        self.remove(list_id)
+        
+        entry = {
+            "id": list_id,
+            "pk": pk,
+            "guild_id": guild_id,
+            "name": name,
+            "archived": archived,
+            "key": self.sort_key(event_at, archived, list_id)
+        }
+        self.entries[list_id] = entry
+        self.by_pk[pk] = list_id
+        bisect.insort(self.ordered.setdefault(guild_id, []), entry["key"])
+        
+        prefixes = self.prefixes.setdefault(guild_id, {})
+        for token in self.tokens(list_id, name):
+            for length in range(1, min(len(token), LIST_INDEX_TOKEN_LENGTH) + 1):
+                prefixes.setdefault(token[:length], set()).add(list_id)
+    
+    def remove(self, list_id):
+        entry = self.entries.pop(list_id, None)
+        if entry is None:
+            return
+        
+        self.by_pk.pop(entry["pk"], None)
+        ordered = self.ordered[entry["guild_id"]]
+        del ordered[bisect.bisect_left(ordered, entry["key"])]
+        
+        prefixes = self.prefixes[entry["guild_id"]]
+        for token in self.tokens(list_id, entry["name"]):
+            for length in range(1, min(len(token), LIST_INDEX_TOKEN_LENGTH) + 1):
+                matches = prefixes.get(token[:length])
+                if matches is not None:
+                    matches.discard(list_id)
+                    if not matches:
+                        del prefixes[token[:length]]
+    
+    def remove_pk(self, pk):
+        list_id = self.by_pk.get(pk)
+        if list_id is not None:
+            self.remove(list_id)
+    
+    def drop_guild(self, guild_id):
+        for key in self.ordered.get(guild_id, []):
+            entry = self.entries.pop(key[2], None)
+            if entry:
+                self.by_pk.pop(entry["pk"], None)
+        self.ordered.pop(guild_id, None)
+        self.prefixes.pop(guild_id, None)
+    
+    def search(self, guild_id, text, include_archived=True, limit=25):
+        words = [word[:LIST_INDEX_TOKEN_LENGTH] for word in LIST_INDEX_WORD_RE.findall(text.lower())]
+        candidates = None
+        if words:
+            prefixes = self.prefixes.get(guild_id, {})
+            candidates = set.intersection(*(prefixes.get(word, set()) for word in words))
+            if not candidates:
+                return []
+        
+        keys = self.ordered.get(guild_id, [])
+        if candidates is not None:
+            if len(candidates) * 8 < len(keys):
+                keys = sorted(self.entries[list_id]["key"] for list_id in candidates)
+            else:
+                keys = (key for key in keys if key[2] in candidates)
+        
+        results = []
+        for key in keys:
+            if key[0] and not include_archived:
+                break
+            results.append(self.entries[key[2]])
+            if len(results) >= limit:
+                break
+        
+        return results
+
+list_index = ListIndex()
+
+def index_list(list_data):
+    list_index.add(
+        list_data["guild_id"], list_data["id"], list_data["pk"], list_data["name"],
+        datetime.fromisoformat(list_data["event_at"] or list_data["created_at"]),
+        is_archived(list_data)
+    )
+
+def index_list_row(row):
+    list_index.add(
+        row['guild_id'], row['id'], row['pk'], row['name'],
+        row['event_at'] or row['created_at'], row['archived_at'] is not None
+    )
+
+async def load_list_index(guild_ids):
+    rows = await db.fetch('''
+        SELECT pk, id, name, guild_id, event_at, created_at, archived_at
+        FROM lists WHERE guild_id = ANY($1::bigint[])
+    ''', list(guild_ids))
+    
+    for guild_id in guild_ids:
+        list_index.drop_guild(guild_id)
+    for row in rows:
+        index_list_row(row)
+    
+    return len(rows)
+
+def drop_cached_rollback(list_data, user_id):
+    list_data["rollbacks"].pop(user_id, None)
+    
+    participant = list_data["participants"].get(user_id)
+    if participant:
+        participant["has_rollback"] = False
+    
+    touch_list(list_data)
+
+def cache_rollback(list_data, user_id, user_name, text, timestamp):
+    list_data["rollbacks"][user_id] = {
+        "user_id": user_id,
+        "user_name": user_name,
+        "text": text,
+        "timestamp": timestamp.isoformat()
+    }
+    
+    participant = list_data["participants"].get(user_id)
+    if participant:
+        participant["has_rollback"] = True
+        participant["display_name"] = user_name
+    
+    touch_list(list_data)
+
+async def submit_rollback(list_data, user_id, user_name, text):
+    row = await db.fetchrow('''
+        WITH participant AS (
+            UPDATE participants SET has_rollback = TRUE, display_name = $3
+            WHERE user_id = $1 AND list_pk = $2
+            RETURNING user_id, display_name
+        ), rollback AS (
+            INSERT INTO rollbacks (user_id, list_pk, user_name, text)
+            SELECT user_id, $2, $3, $4 FROM participant
+            ON CONFLICT (list_pk, user_id)
+            DO UPDATE SET user_name = EXCLUDED.user_name, text = EXCLUDED.text, timestamp = NOW()
+            RETURNING user_id, user_name, text, timestamp
+        )
+        SELECT rollback.* FROM participant JOIN rollback USING (user_id)
+    ''', user_id, list_data["pk"], user_name, text)
+    
+    if not row:
+        list_data["participants"].pop(user_id, None)
+        touch_list(list_data)
+        return None
+    
+    cache_rollback(list_data, user_id, row['user_name'], row['text'], row['timestamp'])
+    
+    return row
+
+async def remove_user_rollback(list_data, user_id):
+    row = await db.fetchrow('''
+        WITH removed AS (
+            DELETE FROM rollbacks WHERE list_pk = $1 AND user_id = $2
+        )
+        UPDATE participants SET has_rollback = FALSE 
+        WHERE list_pk = $1 AND user_id = $2
+        RETURNING user_id
+    ''', list_data["pk"], user_id)
+    
+    drop_cached_rollback(list_data, user_id)
+    
+    return row is not None
+
+async def remove_participant(list_data, user_id):
+    row = await db.fetchrow('''
+        WITH removed AS (
+            DELETE FROM rollbacks WHERE list_pk = $1 AND user_id = $2
+        )
+        DELETE FROM participants WHERE list_pk = $1 AND user_id = $2
+        RETURNING user_id
+    ''', list_data["pk"], user_id)
+    
+    drop_cached_rollback(list_data, user_id)
+    list_data["participants"].pop(user_id, None)
+    
+    return row is not None
+
+async def clear_rollbacks(list_data):
+    await db.execute('''
+        WITH removed AS (
+            DELETE FROM rollbacks WHERE list_pk = $1
+        )
+        UPDATE participants SET has_rollback = FALSE WHERE list_pk = $1
+    ''', list_data["pk"])
+    
+    for participant in list_data["participants"].values():
+        participant["has_rollback"] = False
+    list_data["rollbacks"] = {}
+    touch_list(list_data)
+
+def render_fingerprint(*parts):
+    return hashlib.sha256("\x00".join(part or "" for part in parts).encode()).hexdigest()
+
 def clean_rollback_text(text):
     if not text:
         return ""
@@ -241,96 +1134,343 @@ def clean_rollback_text(text):
     
     return clean_text
 
-async def update_status_message(list_data):
+PRIORITY_INTERACTION = 0
+PRIORITY_USER = 1
+PRIORITY_BACKGROUND = 2
+
+OUTBOUND_CONCURRENCY = int(os.getenv('OUTBOUND_CONCURRENCY', '4'))
+CHANNEL_RATE_LIMIT = int(os.getenv('CHANNEL_RATE_LIMIT', '5'))
+CHANNEL_RATE_PERIOD = float(os.getenv('CHANNEL_RATE_PERIOD', '5'))
+USER_LOOKUP_RATE_LIMIT = int(os.getenv('USER_LOOKUP_RATE_LIMIT', '40'))
+USER_LOOKUP_RATE_PERIOD = float(os.getenv('USER_LOOKUP_RATE_PERIOD', '1'))
+USER_LOOKUP_MAX = int(os.getenv('USER_LOOKUP_MAX', '50'))
+
+# Бюджет канала (5 сообщений за 5 секунд) годится только для сообщений;
+# остальные маршруты получают свои лимиты по префиксу до двоеточия.
+ROUTE_RATE_LIMITS = {
+    "users": (USER_LOOKUP_RATE_LIMIT, USER_LOOKUP_RATE_PERIOD)
+}
+
+class RateLimitBucket:
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = 0.0
+    
+    def ready_at(self, now):
+        if now >= self.reset_at or self.remaining > 0:
+            return now
+        return self.reset_at
+    
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.period
+        self.remaining -= 1
+    
+    def observe(self, headers, now):
+        if not headers:
+            return
+        
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        retry_after = headers.get('Retry-After')
+        
+        if limit is not None:
+            self.limit = int(limit)
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_after is not None:
+            self.reset_at = now + float(reset_after)
+        if retry_after is not None:
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, now + float(retry_after))
+
+class OutboundRequest:
+    def __init__(self, route, priority, factory, key):
+        self.route = route
+        self.priority = priority
+        self.factory = factory
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+
+class OutboundQueue:
+    def __init__(self, concurrency=OUTBOUND_CONCURRENCY, limit=CHANNEL_RATE_LIMIT, period=CHANNEL_RATE_PERIOD):
+        self.concurrency = concurrency
+        self.limit = limit
+        self.period = period
+        self.queues = {PRIORITY_INTERACTION: [], PRIORITY_USER: [], PRIORITY_BACKGROUND: []}
+        self.pending_keys = {}
+        self.buckets = {}
+        self.in_flight = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "superseded": 0,
+            "rate_limited": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0
+        }
+    
+    def depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+    
+    def bucket(self, route):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            limit, period = ROUTE_RATE_LIMITS.get(route.partition(":")[0], (self.limit, self.period))
+            bucket = self.buckets[route] = RateLimitBucket(limit, period)
+        return bucket
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+    
+    async def request(self, route, factory, priority=PRIORITY_USER, key=None):
+        self.start()
+        
+        pending = self.pending_keys.get(key) if key is not None else None
+        if pending is not None:
+            pending.factory = factory
+            if priority < pending.priority:
+                self.queues[pending.priority].remove(pending)
+                pending.priority = priority
+                self.queues[priority].append(pending)
+            self.stats["superseded"] += 1
+            return await asyncio.shield(pending.future)
+        
+        item = OutboundRequest(route, priority, factory, key)
+        self.queues[priority].append(item)
+        if key is not None:
+            self.pending_keys[key] = item
+        self.stats["submitted"] += 1
+        self.wakeup.set()
+        
+        return await asyncio.shield(item.future)
+    
+    def next_ready(self, now):
+        next_at = None
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            blocked_routes = set()
+            for item in queue:
+                if item.route in blocked_routes:
+                    continue
+                ready_at = self.bucket(item.route).ready_at(now)
+                if ready_at <= now:
+                    queue.remove(item)
+                    return item, None
+                blocked_routes.add(item.route)
+                next_at = ready_at if next_at is None else min(next_at, ready_at)
+        return None, next_at
+    
+    async def run(self):
+        while True:
+            if self.in_flight >= self.concurrency or not self.depth():
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            
+            now = time.monotonic()
+            item, next_at = self.next_ready(now)
+            
+            if item is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max(next_at - now, 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            if item.key is not None:
+                self.pending_keys.pop(item.key, None)
+            self.bucket(item.route).take(now)
+            
+            waited = now - item.queued_at
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            metrics.observe("rollback_outbound_wait_seconds", waited, priority=item.priority)
+            
+            self.in_flight += 1
+            asyncio.create_task(self.execute(item))
+    
+    async def execute(self, item):
+        route_kind = item.route.partition(":")[0]
+        started = time.perf_counter()
+        try:
+            result = await item.factory()
+        except Exception as e:
+            metrics.observe("rollback_discord_request_seconds", time.perf_counter() - started, route=route_kind, outcome="error")
+            response = getattr(e, 'response', None)
+            self.bucket(item.route).observe(getattr(response, 'headers', None), time.monotonic())
+            if getattr(e, 'status', None) == 429:
+                self.stats["rate_limited"] += 1
+            self.stats["failed"] += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            metrics.observe("rollback_discord_request_seconds", time.perf_counter() - started, route=route_kind, outcome="ok")
+            self.bucket(item.route).observe(getattr(result, 'headers', None), time.monotonic())
+            self.stats["completed"] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self.wakeup.set()
+
+outbound = OutboundQueue()
+
+def channel_route(channel_id):
+    return f"channel:{channel_id}"
+
+STATUS_MESSAGE_LIMIT = 2000
+STATUS_PREVIEW_LENGTH = 150
+
+def build_status_chunks(list_data):
+    participants = list_data['participants']
+    rollbacks = list_data['rollbacks']
+    
+    total_participants = len(participants)
+    completed_rollbacks = sum(1 for p in participants.values() if p['has_rollback'])
+    
+    header = "".join([
+        f"📊 **СТАТУС ОТКАТОВ: {list_data['name']}**\n\n",
+        f"📋 ID списка: `{list_data['id']}`\n",
+        f"👥 Всего участников: **{total_participants}**\n",
+        f"✅ Отправили откат: **{completed_rollbacks}** / **{total_participants}**\n",
+        f"{'='*50}\n\n"
+    ])
+    
+    if not participants:
+        return [header + "*Список участников пуст*\n"]
+    
+    blocks = []
+    for user_id, participant in sorted(participants.items(), key=lambda x: x[1]['registered_at']):
+        status = "🟢" if participant['has_rollback'] else "🔴"
+        lines = [f"{status} **{participant['display_name']}**\n"]
+        
+        rollback = rollbacks.get(user_id) if participant['has_rollback'] else None
+        if rollback and rollback['text']:
+            rollback_preview = rollback['text'][:STATUS_PREVIEW_LENGTH]
+            if len(rollback['text']) > STATUS_PREVIEW_LENGTH:
+                rollback_preview += "..."
+            lines.append(f"  └ 📝 {rollback_preview}\n")
+        
+        lines.append("\n")
+        blocks.append("".join(lines))
+    
+    chunks = []
+    current = [header]
+    current_length = len(header)
+    for block in blocks:
+        if current_length + len(block) > STATUS_MESSAGE_LIMIT and len(current) > 1:
+            chunks.append("".join(current))
+            continuation = f"📊 **{list_data['name']}** (продолжение)\n\n"
+            current = [continuation]
+            current_length = len(continuation)
+        current.append(block)
+        current_length += len(block)
+    chunks.append("".join(current))
+    
+    return chunks
+
+async def store_status_messages(list_data, message_ids, fingerprints):
+    list_data["status_message_ids"] = message_ids
+    render_fingerprints[(list_data["id"], "status")] = fingerprints
+    
+    await db.execute('''
+        UPDATE lists SET status_message_ids = $1, status_fingerprints = $2 WHERE pk = $3
+    ''', message_ids, fingerprints, list_data["pk"])
+
+def resolve_channel(channel_id):
+    return bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id)
+
+async def update_status_message(list_data, priority=PRIORITY_USER):
     try:
         config = get_server_config(list_data["guild_id"])
         if not config:
             return
             
-        channel_id = config["static_channel_id"]
-        channel = bot.get_channel(channel_id)
-        if not channel:
-            return
+        channel = resolve_channel(config["static_channel_id"])
         
-        list_data = await get_list(list_data["id"], list_data["guild_id"], update_active=True)
-        if not list_data:
-            return
+        chunks = build_status_chunks(list_data)
         
-        total_participants = len(list_data['participants'])
-        completed_rollbacks = sum(1 for p in list_data['participants'].values() if p['has_rollback'])
+        old_ids = list_data["status_message_ids"]
+        old_fingerprints = render_fingerprints.get((list_data["id"], "status"), [])
+        new_ids = []
+        new_fingerprints = []
+        resend = False
         
-        message_content = f"📊 **СТАТУС ОТКАТОВ: {list_data['name']}**\n\n"
-        message_content += f"📋 ID списка: `{list_data['id']}`\n"
-        message_content += f"👥 Всего участников: **{total_participants}**\n"
-        message_content += f"✅ Отправили откат: **{completed_rollbacks}** / **{total_participants}**\n"
-        message_content += f"{'='*50}\n\n"
-        
-        if not list_data['participants']:
-            message_content += "*Список участников пуст*\n"
-        else:
-            for user_id, participant in sorted(list_data['participants'].items(), key=lambda x: x[1]['registered_at']):
-                status = "🟢" if participant['has_rollback'] else "🔴"
-                username = participant['display_name']
-                message_content += f"{status} **{username}**\n"
+        try:
+            for index, chunk in enumerate(chunks):
+                fingerprint = render_fingerprint(chunk)
+                message_id = old_ids[index] if index < len(old_ids) and not resend else None
                 
-                if participant['has_rollback']:
-                    user_rollback = None
-                    for rollback in list_data['rollbacks'].values():
-                        if rollback['user_id'] == user_id:
-                            user_rollback = rollback
-                            break
-                    if user_rollback:
-                        rollback_text = user_rollback['text']
-                        if rollback_text:
-                            rollback_preview = rollback_text[:150]
-                            if len(rollback_text) > 150:
-                                rollback_preview += "..."
-                            message_content += f"  └ 📝 {rollback_preview}\n"
-                message_content += "\n"
-        
-        status_message_id = list_data.get("status_message_id")
-        
-        if status_message_id:
-            try:
-                status_message = await channel.fetch_message(status_message_id)
-                await status_message.edit(content=message_content)
-                return
-            except:
-                pass
+                if message_id:
+                    if index < len(old_fingerprints) and old_fingerprints[index] == fingerprint:
+                        new_ids.append(message_id)
+                        new_fingerprints.append(fingerprint)
+                        continue
+                    
+                    try:
+                        await outbound.request(
+                            channel_route(channel.id),
+                            lambda message_id=message_id, chunk=chunk: channel.get_partial_message(message_id).edit(content=chunk),
+                            priority,
+                            key=("edit", message_id)
+                        )
+                    except disnake.NotFound:
+                        logger.warning("⚠️ Сообщение статуса списка удалено, создаем новое", extra=log_context(list_id=list_data["id"]))
+                        resend = True
+                    else:
+                        new_ids.append(message_id)
+                        new_fingerprints.append(fingerprint)
+                        continue
+                
+                new_message = await outbound.request(
+                    channel_route(channel.id),
+                    lambda chunk=chunk: channel.send(chunk),
+                    priority
+                )
+                new_ids.append(new_message.id)
+                new_fingerprints.append(fingerprint)
+        except Exception:
+            if not resend:
+                tail = old_ids[len(new_ids):]
+                new_ids += tail
+                new_fingerprints += [""] * len(tail)
+            if new_ids != old_ids or new_fingerprints != old_fingerprints:
+                await store_status_messages(list_data, new_ids, new_fingerprints)
+            raise
         
-        new_message = await channel.send(message_content)
+        if new_ids != old_ids or new_fingerprints != old_fingerprints:
+            await store_status_messages(list_data, new_ids, new_fingerprints)
         
-        await db.pool.execute('''
-            UPDATE lists SET status_message_id = $1 WHERE id = $2
-        ''', new_message.id, list_data["id"])
+        for message_id in old_ids:
+            if message_id not in new_ids:
+                try:
+                    await outbound.request(
+                        channel_route(channel.id),
+                        lambda message_id=message_id: channel.get_partial_message(message_id).delete(),
+                        priority
+                    )
+                except disnake.NotFound:
+                    pass
         
     except Exception as e:
-        print(f"Ошибка при обновлении статуса списка {list_data['id']}: {e}")
+        metrics.inc("rollback_render_errors_total", message="status")
+        logger.error(f"❌ Ошибка при обновлении статуса списка: {e}", extra=log_context(list_id=list_data["id"]))
 
-async def update_participants_message(channel, list_data):
+async def update_participants_message(channel, list_data, priority=PRIORITY_USER):
     if not list_data:
         return
     
-    list_data = await get_list(list_data["id"], list_data["guild_id"], update_active=True)
-    if not list_data:
-        return
-    
-    if list_data.get("message_id"):
-        try:
-            message = await channel.fetch_message(list_data["message_id"])
-            embed = disnake.Embed(
-                title=f"📋 {list_data['name']}",
-                description=await generate_participants_list(list_data),
-                color=0x2b2d31
-            )
-            embed.set_footer(text=f"ID: {list_data['id']} | Регистрация через администратора")
-            
-            view = MainView(list_data["id"], list_data["guild_id"])
-            await message.edit(embed=embed, view=view)
-            return
-        except:
-            pass
-    
     embed = disnake.Embed(
         title=f"📋 {list_data['name']}",
         description=await generate_participants_list(list_data),
@@ -338,12 +1478,52 @@ async def update_participants_message(channel, list_data):
     )
     embed.set_footer(text=f"ID: {list_data['id']} | Регистрация через администратора")
     
-    view = MainView(list_data["id"], list_data["guild_id"])
-    message = await channel.send(embed=embed, view=view)
+    fingerprint = render_fingerprint(embed.title, embed.description, embed.footer.text)
+    fingerprint_key = (list_data["id"], "participants")
+    previous_fingerprint = render_fingerprints.get(fingerprint_key)
     
-    await db.pool.execute('''
-        UPDATE lists SET message_id = $1 WHERE id = $2
-    ''', message.id, list_data["id"])
+    if list_data.get("message_id"):
+        if previous_fingerprint == fingerprint:
+            return
+        
+        # Кнопки сохраняются в сообщении между правками; прикрепляем их
+        # заново только к сообщениям, для которых еще нет отпечатка.
+        edit_kwargs = {"embed": embed}
+        if previous_fingerprint is None:
+            edit_kwargs["components"] = main_components(list_data["id"])
+        
+        message_id = list_data["message_id"]
+        try:
+            await outbound.request(
+                channel_route(channel.id),
+                lambda: channel.get_partial_message(message_id).edit(**edit_kwargs),
+                priority,
+                key=("edit", message_id)
+            )
+        except disnake.NotFound:
+            logger.warning("⚠️ Сообщение списка удалено, создаем новое", extra=log_context(list_id=list_data["id"]))
+            await db.execute('''
+                UPDATE lists SET message_id = NULL WHERE pk = $1
+            ''', list_data["pk"])
+            list_data["message_id"] = None
+        else:
+            render_fingerprints[fingerprint_key] = fingerprint
+            await db.execute('''
+                UPDATE lists SET participants_fingerprint = $1 WHERE pk = $2
+            ''', fingerprint, list_data["pk"])
+            return
+    
+    message = await outbound.request(
+        channel_route(channel.id),
+        lambda: channel.send(embed=embed, components=main_components(list_data["id"])),
+        priority
+    )
+    
+    await db.execute('''
+        UPDATE lists SET message_id = $1, participants_fingerprint = $2 WHERE pk = $3
+    ''', message.id, fingerprint, list_data["pk"])
+    list_data["message_id"] = message.id
+    render_fingerprints[fingerprint_key] = fingerprint
 
 async def generate_participants_list(list_data):
     if not list_data or not list_data["participants"]:
@@ -363,53 +1543,490 @@ async def generate_participants_list(list_data):
     
     return "\n".join(lines)
 
-@tasks.loop(seconds=30)
+SAFETY_SWEEP_MINUTES = int(os.getenv('SAFETY_SWEEP_MINUTES', '10'))
+
+RENDER_DEBOUNCE_SECONDS = float(os.getenv('RENDER_DEBOUNCE_SECONDS', '2'))
+RENDER_MAX_LATENCY_SECONDS = float(os.getenv('RENDER_MAX_LATENCY_SECONDS', '5'))
+
+dirty_lists = {}
+rendering_lists = set()
+render_wakeup = asyncio.Event()
+render_task = None
+
+def mark_dirty(list_id, priority=PRIORITY_USER):
+    now = time.monotonic()
+    pending = dirty_lists.get(list_id)
+    if pending:
+        pending[1] = now
+        pending[2] = min(pending[2], priority)
+    else:
+        dirty_lists[list_id] = [now, now, priority]
+    render_wakeup.set()
+
+def render_due_at(pending):
+    first_marked, last_marked, priority = pending
+    return min(last_marked + RENDER_DEBOUNCE_SECONDS, first_marked + RENDER_MAX_LATENCY_SECONDS)
+
+async def render_list(list_id, priority=PRIORITY_USER):
+    list_data = active_lists.get(list_id)
+    if not list_data:
+        return
+    
+    await render_list_data(list_data, priority)
+
+render_locks = {}
+
+@contextlib.asynccontextmanager
+async def render_guard(list_id):
+    # Одна отрисовка списка за раз: параллельные отрисовки отправляют новые
+    # сообщения статуса независимо друг от друга и оставляют дубликаты.
+    entry = render_locks.get(list_id)
+    if entry is None:
+        entry = render_locks[list_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del render_locks[list_id]
+
+async def render_list_data(list_data, priority=PRIORITY_USER):
+    async with render_guard(list_data["id"]):
+        with metrics.timer("rollback_render_seconds", message="participants"):
+            await update_participants_message(resolve_channel(list_data["channel_id"]), list_data, priority)
+        with metrics.timer("rollback_render_seconds", message="status"):
+            await update_status_message(list_data, priority)
+
+async def render_dirty_list(list_id, priority):
+    rendering_lists.add(list_id)
+    try:
+        await render_list(list_id, priority)
+    except Exception as e:
+        metrics.inc("rollback_render_errors_total", message="participants")
+        logger.error(f"❌ Ошибка при отрисовке списка: {e}", extra=log_context(list_id=list_id))
+    finally:
+        rendering_lists.discard(list_id)
+        render_wakeup.set()
+
+async def render_worker():
+    while True:
+        if not db.available:
+            await db.ready.wait()
+            continue
+        
+        waiting = {list_id: pending for list_id, pending in dirty_lists.items() if list_id not in rendering_lists}
+        if not waiting:
+            render_wakeup.clear()
+            await render_wakeup.wait()
+            continue
+        
+        now = time.monotonic()
+        due = [list_id for list_id, pending in waiting.items() if render_due_at(pending) <= now]
+        
+        if not due:
+            next_due = min(render_due_at(pending) for pending in waiting.values())
+            render_wakeup.clear()
+            try:
+                await asyncio.wait_for(render_wakeup.wait(), timeout=next_due - now)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        for list_id in due:
+            pending = dirty_lists.pop(list_id)
+            asyncio.create_task(render_dirty_list(list_id, pending[2]))
+
+REFRESH_HOT_MINUTES = int(os.getenv('REFRESH_HOT_MINUTES', '1'))
+REFRESH_WARM_MINUTES = int(os.getenv('REFRESH_WARM_MINUTES', str(SAFETY_SWEEP_MINUTES)))
+REFRESH_COLD_MINUTES = int(os.getenv('REFRESH_COLD_MINUTES', '60'))
+HOT_WINDOW_HOURS = float(os.getenv('HOT_WINDOW_HOURS', '2'))
+WARM_WINDOW_HOURS = float(os.getenv('WARM_WINDOW_HOURS', '24'))
+
+refreshed_at = {}
+
+def refresh_interval(list_data, now):
+    if not list_data.get("event_at"):
+        return REFRESH_COLD_MINUTES
+    
+    until_event = datetime.fromisoformat(list_data["event_at"]) - now
+    if abs(until_event) <= timedelta(hours=HOT_WINDOW_HOURS):
+        return REFRESH_HOT_MINUTES
+    if timedelta(0) < until_event <= timedelta(hours=WARM_WINDOW_HOURS):
+        return REFRESH_WARM_MINUTES
+    return REFRESH_COLD_MINUTES
+
+@tasks.loop(minutes=max(REFRESH_HOT_MINUTES, 1))
 async def auto_update_lists():
+    # Без базы отрисовка не сохранит состояние сообщений; списки обновятся после восстановления.
+    if not db.available:
+        return
+    
     try:
-        print(f"🔄 Авто-обновление списков... ({len(active_lists)} активных списков)")
+        now = event_now()
+        tick = time.monotonic()
+        queued = 0
         
         for list_id, list_data in list(active_lists.items()):
-            try:
-                current_list_data = await get_list(list_id, list_data["guild_id"], update_active=True)
-                if not current_list_data:
-                    del active_lists[list_id]
-                    continue
-                
-                channel = bot.get_channel(current_list_data["channel_id"])
-                if channel:
-                    await update_participants_message(channel, current_list_data)
-                
-                await update_status_message(current_list_data)
-                
-                print(f"✅ Обновлен список: {list_id} (участников: {len(current_list_data['participants'])}, откатов: {len(current_list_data['rollbacks'])})")
-                
-            except Exception as e:
-                print(f"❌ Ошибка при авто-обновлении списка {list_id}: {e}")
+            last = refreshed_at.get(list_id)
+            # Небольшой запас, чтобы дрейф цикла не пропускал целый интервал.
+            # Отпечатки сохраняются: неизменные списки не трогают ни базу, ни
+            # Discord, а удаленные сообщения ловит NotFound при следующей правке.
+            if last is None or tick - last >= refresh_interval(list_data, now) * 60 - 5:
+                refreshed_at[list_id] = tick
+                mark_dirty(list_id, PRIORITY_BACKGROUND)
+                queued += 1
+        
+        for list_id in [list_id for list_id in refreshed_at if list_id not in active_lists]:
+            del refreshed_at[list_id]
+        
+        logger.debug("Контрольное обновление поставлено в очередь", extra=log_context(lists=queued, cached=len(active_lists)))
+        
+    except Exception as e:
+        logger.error(f"❌ Критическая ошибка в auto_update_lists: {e}")
+
+@tasks.loop(seconds=DB_HEALTH_CHECK_SECONDS)
+async def database_health_check():
+    if not db.available:
+        return
+    
+    try:
+        await db.check_health()
+        db.failures = 0
+    except Exception as e:
+        logger.warning(f"⚠️ Проверка соединения с базой не прошла: {e}")
+        db.record_failure(e)
+
+ARCHIVE_AFTER_HOURS = float(os.getenv('ARCHIVE_AFTER_HOURS', '24'))
+ARCHIVE_CHECK_MINUTES = int(os.getenv('ARCHIVE_CHECK_MINUTES', '10'))
+
+@tasks.loop(minutes=max(ARCHIVE_CHECK_MINUTES, 1))
+async def archive_lists():
+    if not is_leader or not db.available:
+        return
+    
+    try:
+        # event_at задан в поясе события, created_at - по часам базы; первое
+        # условие только сужает выборку по индексу lists_unarchived_event_idx.
+        rows = await db.fetch('''
+            UPDATE lists SET archived_at = NOW()
+            WHERE archived_at IS NULL
+                AND COALESCE(event_at, created_at) < GREATEST($1, NOW()::timestamp - $2::interval)
+                AND (event_at < $1 OR (event_at IS NULL AND created_at < NOW()::timestamp - $2::interval))
+            RETURNING pk, id, name, guild_id, event_at, created_at, archived_at
+        ''', event_now() - timedelta(hours=ARCHIVE_AFTER_HOURS), timedelta(hours=ARCHIVE_AFTER_HOURS))
+        
+        for row in rows:
+            evict_list(row['id'])
+            index_list_row(row)
         
-        print(f"✅ Авто-обновление завершено")
+        if rows:
+            logger.info("🗄 Списки перенесены в архив", extra=log_context(lists=len(rows)))
         
     except Exception as e:
-        print(f"❌ Критическая ошибка в auto_update_lists: {e}")
+        logger.error(f"❌ Ошибка при архивации списков: {e}")
+
+HEARTBEAT_SECONDS = int(os.getenv('HEARTBEAT_SECONDS', '15'))
+INSTANCE_TIMEOUT_SECONDS = int(os.getenv('INSTANCE_TIMEOUT_SECONDS', '60'))
+ORPHAN_SWEEP_SECONDS = int(os.getenv('ORPHAN_SWEEP_SECONDS', '60'))
+BACKGROUND_LEASE = "background"
+
+is_leader = False
+
+def instance_shards():
+    shard_count = SHARD_COUNT or 1
+    return shard_count, SHARD_IDS or list(range(shard_count))
+
+@tasks.loop(seconds=HEARTBEAT_SECONDS)
+async def cluster_heartbeat():
+    global is_leader
+    
+    if not db.available:
+        is_leader = False
+        return
+    
+    try:
+        shard_count, shard_ids = instance_shards()
+        await db.execute('''
+            INSERT INTO bot_instances (instance_id, shard_count, shard_ids, heartbeat_at)
+            VALUES ($1, $2, $3, NOW())
+            ON CONFLICT (instance_id)
+            DO UPDATE SET shard_count = EXCLUDED.shard_count, shard_ids = EXCLUDED.shard_ids, heartbeat_at = NOW()
+        ''', INSTANCE_ID, shard_count, shard_ids)
+        
+        holder = await db.fetchval('''
+            INSERT INTO worker_leases (name, holder, expires_at)
+            VALUES ($1, $2, NOW() + $3::interval)
+            ON CONFLICT (name)
+            DO UPDATE SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+            WHERE worker_leases.holder = EXCLUDED.holder OR worker_leases.expires_at < NOW()
+            RETURNING holder
+        ''', BACKGROUND_LEASE, INSTANCE_ID, timedelta(seconds=INSTANCE_TIMEOUT_SECONDS))
+        
+        leader = holder == INSTANCE_ID
+        if leader != is_leader:
+            logger.info("👑 Экземпляр стал ведущим" if leader else "⚠️ Экземпляр больше не ведущий", extra=log_context(instance=INSTANCE_ID))
+        is_leader = leader
+        
+    except Exception as e:
+        is_leader = False
+        logger.error(f"❌ Ошибка heartbeat экземпляра: {e}", extra=log_context(instance=INSTANCE_ID))
+
+@tasks.loop(seconds=ORPHAN_SWEEP_SECONDS)
+async def orphan_sweep():
+    if not is_leader or not db.available:
+        return
+    
+    try:
+        rows = await db.fetch('''
+            SELECT l.id FROM lists l
+            WHERE l.archived_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM bot_instances i
+                WHERE i.heartbeat_at > NOW() - $1::interval
+                  AND ((l.guild_id >> 22) % i.shard_count) = ANY(i.shard_ids)
+            )
+        ''', timedelta(seconds=INSTANCE_TIMEOUT_SECONDS))
+        
+        if not rows:
+            return
+        
+        orphan_ids = [row['id'] for row in rows]
+        for list_id in orphan_ids:
+            render_fingerprints.pop((list_id, "participants"), None)
+            render_fingerprints.pop((list_id, "status"), None)
+        
+        try:
+            orphans = await load_lists(orphan_ids, update_active=False)
+            for list_data in orphans.values():
+                try:
+                    await render_list_data(list_data, PRIORITY_BACKGROUND)
+                except Exception as e:
+                    metrics.inc("rollback_render_errors_total", message="orphan")
+                    logger.error(f"❌ Ошибка при отрисовке списка без владельца: {e}", extra=log_context(list_id=list_data["id"]))
+        finally:
+            # Списки без владельца не кэшируются: их отпечатки нужны только на время отрисовки.
+            for list_id in orphan_ids:
+                if list_id not in active_lists:
+                    render_fingerprints.pop((list_id, "participants"), None)
+                    render_fingerprints.pop((list_id, "status"), None)
+        
+        logger.debug("Обновлены списки без владельца", extra=log_context(lists=len(orphans)))
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка при обновлении списков без владельца: {e}")
+
+CHANGE_CHANNEL = "list_changes"
+LISTENER_PING_SECONDS = 30
+
+pending_changes = {}
+change_wakeup = asyncio.Event()
+change_tasks = []
+
+def on_list_change(connection, pid, channel, payload):
+    if pid in db.backend_pids:
+        return
+    
+    try:
+        change = json.loads(payload)
+    except ValueError:
+        return
+    
+    queue_change(change["list_pk"], change.get("guild_id"), [change["version"]])
+
+def queue_change(list_pk, guild_id, txids):
+    pending = pending_changes.setdefault(list_pk, [None, set()])
+    pending[0] = pending[0] or guild_id
+    pending[1].update(txids)
+    change_wakeup.set()
+
+def find_cached_list(list_pk):
+    for list_data in active_lists.values():
+        if list_data["pk"] == list_pk:
+            return list_data
+    return None
+
+async def apply_list_changes():
+    while True:
+        await change_wakeup.wait()
+        change_wakeup.clear()
+        
+        changes = dict(pending_changes)
+        pending_changes.clear()
+        
+        try:
+            list_ids = {}
+            versions = {}
+            for list_pk, (guild_id, txids) in changes.items():
+                cached = find_cached_list(list_pk)
+                if cached:
+                    # Кэш уже загружен снимком, в котором эти транзакции видны.
+                    # Без txid (повтор после переподключения) список перечитывается всегда.
+                    if txids and snapshot_covers(cached["snapshot"], txids):
+                        continue
+                    list_ids[cached["id"]] = list_pk
+                    versions[cached["id"]] = cached["version"]
+                elif guild_id and bot.get_guild(guild_id):
+                    row = await db.fetchrow('SELECT id FROM lists WHERE pk = $1', list_pk)
+                    if row:
+                        list_ids[row['id']] = list_pk
+                    else:
+                        list_index.remove_pk(list_pk)
+            
+            if not list_ids:
+                continue
+            
+            loaded = await load_lists(list_ids, expected_versions=versions)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обновлении списков по уведомлению: {e}")
+            continue
+        
+        for list_id, list_pk in list_ids.items():
+            if list_id in loaded and loaded[list_id] is None:
+                # Локальная запись обогнала перезагрузку: изменение повторяется.
+                queue_change(list_pk, *changes[list_pk])
+            elif list_id in active_lists:
+                mark_dirty(list_id)
+            else:
+                evict_list(list_id)
+
+async def listen_for_changes():
+    delay = 1
+    first_connection = True
+    
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(db.database_url)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(CHANGE_CHANNEL, on_list_change)
+            logger.info("✅ Подписка на изменения списков установлена")
+            
+            if not first_connection:
+                await load_list_index([guild.id for guild in bot.guilds])
+                versions = {list_id: list_data["version"] for list_id, list_data in active_lists.items()}
+                loaded = await load_lists(list(versions), expected_versions=versions)
+                for list_id in versions:
+                    list_data = active_lists.get(list_id)
+                    if list_data is None:
+                        continue
+                    if list_id in loaded and loaded[list_id] is None:
+                        # Локальная запись обогнала перезагрузку: список перечитается как по уведомлению.
+                        queue_change(list_data["pk"], list_data["guild_id"], [])
+                    else:
+                        mark_dirty(list_id, PRIORITY_BACKGROUND)
+            first_connection = False
+            delay = 1
+            
+            while not closed.is_set():
+                try:
+                    await asyncio.wait_for(closed.wait(), timeout=LISTENER_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    await connection.execute('SELECT 1', timeout=10)
+        except Exception as e:
+            logger.error(f"❌ Ошибка подписки на изменения списков: {e}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                connection.terminate()
+        
+        logger.warning(f"⏳ Переподключение подписки на изменения через {delay} сек...")
+        await asyncio.sleep(delay + random.random())
+        delay = min(delay * 2, 60)
+
+warmup_done = False
 
 @bot.event
 async def on_ready():
-    print(f'Bot {bot.user} готов к работе!')
-    print(f'Подключен к {len(bot.guilds)} серверам')
+    global warmup_done, render_task
+    
+    logger.info(f'Bot {bot.user} готов к работе!')
+    logger.info(f'Подключен к {len(bot.guilds)} серверам')
     
+    if not warmup_done:
+        try:
+            loaded = await load_guild_lists([guild.id for guild in bot.guilds])
+            indexed = await load_list_index([guild.id for guild in bot.guilds])
+            warmup_done = True
+            logger.info(f"📋 Загружено активных списков: {len(loaded)}, в индексе автодополнения: {indexed}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при загрузке активных списков: {e}")
+    
+    if render_task is None:
+        render_task = asyncio.create_task(render_worker())
+        logger.info("✅ Обработчик обновлений списков запущен")
+    
+    if not change_tasks:
+        change_tasks.append(asyncio.create_task(apply_list_changes()))
+        change_tasks.append(asyncio.create_task(listen_for_changes()))
+    
+    if not database_health_check.is_running():
+        database_health_check.start()
+    if not cluster_heartbeat.is_running():
+        cluster_heartbeat.start()
+    if not orphan_sweep.is_running():
+        orphan_sweep.start()
+    
+    if SAFETY_SWEEP_MINUTES > 0 and not auto_update_lists.is_running():
+        auto_update_lists.start()
+        logger.info(
+            f"✅ Контрольное обновление списков запущено "
+            f"(у события: {REFRESH_HOT_MINUTES} мин, накануне: {REFRESH_WARM_MINUTES} мин, остальные: {REFRESH_COLD_MINUTES} мин)"
+        )
+    if ARCHIVE_AFTER_HOURS > 0 and not archive_lists.is_running():
+        archive_lists.start()
+    logger.info("✅ Бот запущен и готов к работе!")
+
+@bot.event
+async def on_guild_remove(guild):
+    for list_id in [list_id for list_id, list_data in active_lists.items() if list_data["guild_id"] == guild.id]:
+        evict_list(list_id)
+    list_index.drop_guild(guild.id)
+
+@bot.event
+async def on_guild_join(guild):
     try:
-        for guild in bot.guilds:
-            rows = await db.pool.fetch('SELECT id FROM lists WHERE guild_id = $1', guild.id)
-            for row in rows:
-                list_data = await get_list(row['id'], guild.id)
-                if list_data:
-                    active_lists[list_data["id"]] = list_data
-                    print(f"📋 Загружен активный список: {list_data['id']}")
+        loaded = await load_guild_lists([guild.id])
+        await load_list_index([guild.id])
+        logger.info("📋 Загружены списки сервера", extra=log_context(guild_id=guild.id, lists=len(loaded)))
     except Exception as e:
-        print(f"❌ Ошибка при загрузке активных списков: {e}")
-    
-    auto_update_lists.start()
-    print("✅ Авто-обновление списков запущено (каждые 30 секунд)")
-    print("✅ Бот запущен и готов к работе!")
+        logger.error(f"❌ Ошибка при загрузке списков сервера: {e}", extra=log_context(guild_id=guild.id))
+
+interaction_started = {}
+
+def timed_handler(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                metrics.observe("rollback_handler_seconds", time.perf_counter() - started, handler=name, outcome=outcome)
+        return wrapper
+    return decorator
+
+@bot.before_slash_command_invoke
+async def start_command_timer(inter: disnake.ApplicationCommandInteraction):
+    interaction_started[inter.id] = time.perf_counter()
+
+@bot.after_slash_command_invoke
+async def stop_command_timer(inter: disnake.ApplicationCommandInteraction):
+    started = interaction_started.pop(inter.id, None)
+    if started is not None:
+        outcome = "error" if inter.command_failed else "ok"
+        metrics.observe("rollback_handler_seconds", time.perf_counter() - started, handler=f"command:{inter.application_command.qualified_name}", outcome=outcome)
+
+@bot.event
+async def on_slash_command_error(inter: disnake.ApplicationCommandInteraction, error):
+    original = getattr(error, "original", error)
+    if await reply_if_database_unavailable(inter, original):
+        return
+    logger.error(f"❌ Ошибка команды /{inter.application_command.qualified_name}: {original}", exc_info=original)
 
 class CreateListModal(disnake.ui.Modal):
     def __init__(self, guild_id):
@@ -450,22 +2067,35 @@ class CreateListModal(disnake.ui.Modal):
         ]
         super().__init__(title="Создание нового списка", components=components)
 
+    async def on_error(self, error, inter):
+        if not await reply_if_database_unavailable(inter, error):
+            await super().on_error(error, inter)
+    
+    @timed_handler("modal:create_list")
     async def callback(self, inter: disnake.ModalInteraction):
         time_value = inter.text_values["time"].strip()
         date_value = inter.text_values["date"].strip()
         name_value = inter.text_values["name"].strip()
         server_value = inter.text_values["event_server"].strip()
         
+        event_at = parse_event_time(date_value, time_value)
+        if not event_at:
+            await inter.response.send_message(
+                "❌ Не удалось разобрать дату и время события! Используйте формат 18:00 и 25.10.2025.",
+                ephemeral=True
+            )
+            return
+        
         list_id = generate_list_id()
         
-        existing = await db.pool.fetchrow('SELECT id FROM lists WHERE id = $1', list_id)
+        existing = await db.fetchrow('SELECT id FROM lists WHERE id = $1', list_id)
         while existing:
             list_id = generate_list_id()
-            existing = await db.pool.fetchrow('SELECT id FROM lists WHERE id = $1', list_id)
+            existing = await db.fetchrow('SELECT id FROM lists WHERE id = $1', list_id)
         
         full_name = f"{time_value} | {date_value} | {name_value} | {server_value}"
         
-        list_data = await create_new_list(list_id, full_name, inter.channel_id, str(inter.author.id), self.guild_id)
+        list_data = await create_new_list(list_id, full_name, inter.channel_id, inter.author.id, self.guild_id, event_at)
         
         config = get_server_config(self.guild_id)
         static_channel_mention = f"<#{config['static_channel_id']}>" if config else "не указан"
@@ -481,8 +2111,7 @@ class CreateListModal(disnake.ui.Modal):
             ephemeral=True
         )
         
-        await update_participants_message(inter.channel, list_data)
-        await update_status_message(list_data)
+        mark_dirty(list_data["id"])
 
 class RollbackModal(disnake.ui.Modal):
     def __init__(self, list_id, guild_id, has_existing_rollback=False):
@@ -508,13 +2137,22 @@ class RollbackModal(disnake.ui.Modal):
         title = "Заменить откат" if has_existing_rollback else "Отправить откат"
         super().__init__(title=title, components=components)
 
+    async def on_error(self, error, inter):
+        if not await reply_if_database_unavailable(inter, error):
+            await super().on_error(error, inter)
+    
+    @timed_handler("modal:rollback")
     async def callback(self, inter: disnake.ModalInteraction):
         list_data = await get_list(self.list_id, self.guild_id)
         if not list_data:
             await inter.response.send_message("❌ Список не найден!", ephemeral=True)
             return
+        
+        if is_archived(list_data):
+            await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+            return
             
-        user_id = str(inter.author.id)
+        user_id = inter.author.id
         
         if user_id not in list_data["participants"]:
             await inter.response.send_message(
@@ -536,146 +2174,284 @@ class RollbackModal(disnake.ui.Modal):
         
         server_nickname = inter.author.display_name
         
-        if self.has_existing_rollback:
-            await remove_user_rollback(list_data, user_id)
+        if not await submit_rollback(list_data, user_id, server_nickname, cleaned_text):
+            await inter.response.send_message(
+                "❌ Вы не зарегистрированы в этом списке! Обратитесь к администратору.",
+                ephemeral=True
+            )
+            return
         
-        await db.pool.execute('''
-            INSERT INTO rollbacks (user_id, list_id, user_name, text)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (user_id, list_id) 
-            DO UPDATE SET user_name = $3, text = $4, timestamp = NOW()
-        ''', user_id, self.list_id, server_nickname, cleaned_text)
+        if self.has_existing_rollback:
+            message = f"✅ Ваш откат в списке '{list_data['name']}' заменен на новый! Статус обновлен."
+        else:
+            message = f"✅ Ваш откат отправлен в список '{list_data['name']}'! Статус обновлен."
+            
+        await inter.response.send_message(message, ephemeral=True)
         
-        await db.pool.execute('''
-            UPDATE participants SET has_rollback = TRUE, display_name = $3
-            WHERE user_id = $1 AND list_id = $2
-        ''', user_id, self.list_id, server_nickname)
+        mark_dirty(list_data["id"])
+
+BUTTON_PREFIX = "rollback"
+button_handlers = {}
+
+def button_custom_id(action, list_id=""):
+    return f"{BUTTON_PREFIX}:{action}:{list_id}"
+
+def button_handler(action):
+    def decorator(func):
+        button_handlers[action] = timed_handler(f"button:{action}")(func)
+        return func
+    return decorator
+
+def main_components(list_id):
+    return [
+        disnake.ui.Button(label="Отправить откат", style=disnake.ButtonStyle.primary, custom_id=button_custom_id("open", list_id)),
+        disnake.ui.Button(label="Обновить список", style=disnake.ButtonStyle.secondary, custom_id=button_custom_id("refresh", list_id))
+    ]
+
+def choice_components(list_id):
+    return [
+        disnake.ui.Button(label="Заменить откат", style=disnake.ButtonStyle.primary, custom_id=button_custom_id("replace", list_id)),
+        disnake.ui.Button(label="Удалить откат", style=disnake.ButtonStyle.danger, custom_id=button_custom_id("delete", list_id)),
+        disnake.ui.Button(label="Отмена", style=disnake.ButtonStyle.secondary, custom_id=button_custom_id("cancel"))
+    ]
+
+def delete_components(list_id):
+    return [
+        disnake.ui.Button(label="Да, удалить мой откат", style=disnake.ButtonStyle.danger, custom_id=button_custom_id("confirm_delete", list_id)),
+        disnake.ui.Button(label="Отмена", style=disnake.ButtonStyle.secondary, custom_id=button_custom_id("cancel_delete"))
+    ]
+
+@bot.listen("on_button_click")
+async def dispatch_button(inter: disnake.MessageInteraction):
+    prefix, _, rest = (inter.component.custom_id or "").partition(":")
+    if prefix != BUTTON_PREFIX:
+        return
+    
+    action, _, list_id = rest.partition(":")
+    handler = button_handlers.get(action)
+    if handler:
+        try:
+            await handler(inter, list_id)
+        except DatabaseUnavailable as e:
+            await reply_if_database_unavailable(inter, e)
+
+@button_handler("open")
+async def open_rollback_button(inter: disnake.MessageInteraction, list_id):
+    db.ensure_available()
+    
+    list_data = await get_list(list_id, inter.guild_id)
+    if not list_data:
+        await inter.response.send_message("❌ Список не найден!", ephemeral=True)
+        return
+    
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
         
-        if self.has_existing_rollback:
-            message = f"✅ Ваш откат в списке '{list_data['name']}' заменен на новый! Статус обновлен."
-        else:
-            message = f"✅ Ваш откат отправлен в список '{list_data['name']}'! Статус обновлен."
-            
-        await inter.response.send_message(message, ephemeral=True)
+    user_id = inter.author.id
+    if user_id not in list_data["participants"]:
+        await inter.response.send_message(
+            "❌ Вы не зарегистрированы в этом списке! Обратитесь к администратору.",
+            ephemeral=True
+        )
+        return
+    
+    has_existing_rollback = list_data["participants"][user_id]["has_rollback"]
+    
+    if has_existing_rollback:
+        await inter.response.send_message(
+            "📝 У вас уже есть отправленный откат. Что вы хотите сделать?",
+            components=choice_components(list_id),
+            ephemeral=True
+        )
+    else:
+        await inter.response.send_modal(RollbackModal(list_id, inter.guild_id, has_existing_rollback=False))
+
+@button_handler("refresh")
+async def refresh_button(inter: disnake.MessageInteraction, list_id):
+    await inter.response.defer(ephemeral=True)
+    list_data = await get_list(list_id, inter.guild_id, refresh=True)
+    if not list_data:
+        await inter.followup.send("❌ Список не найден!", ephemeral=True)
+        return
+    
+    if is_archived(list_data):
+        await inter.followup.send(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
         
-        channel = bot.get_channel(list_data["channel_id"])
-        if channel:
-            await update_participants_message(channel, list_data)
-        await update_status_message(list_data)
+    dirty_lists.pop(list_data["id"], None)
+    await render_list(list_data["id"], PRIORITY_INTERACTION)
+    await inter.edit_original_response(content="✅ Оба списка обновлены!")
 
-class DeleteRollbackView(disnake.ui.View):
-    def __init__(self, list_id, guild_id):
-        super().__init__(timeout=60)
-        self.list_id = list_id
-        self.guild_id = guild_id
+@button_handler("replace")
+async def replace_rollback_button(inter: disnake.MessageInteraction, list_id):
+    db.ensure_available()
+    await inter.response.send_modal(RollbackModal(list_id, inter.guild_id, has_existing_rollback=True))
+
+@button_handler("delete")
+async def delete_rollback_button(inter: disnake.MessageInteraction, list_id):
+    await inter.response.send_message(
+        "❓ Вы уверены, что хотите удалить свой откат?",
+        components=delete_components(list_id),
+        ephemeral=True
+    )
+
+@button_handler("cancel")
+async def cancel_choice_button(inter: disnake.MessageInteraction, list_id):
+    await inter.response.send_message("❌ Действие отменено.", ephemeral=True)
+
+@button_handler("confirm_delete")
+async def confirm_delete_button(inter: disnake.MessageInteraction, list_id):
+    list_data = await get_list(list_id, inter.guild_id)
+    if not list_data:
+        await inter.response.send_message("❌ Список не найден!", ephemeral=True)
+        return
     
-    @disnake.ui.button(label="Да, удалить мой откат", style=disnake.ButtonStyle.danger)
-    async def confirm_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        list_data = await get_list(self.list_id, self.guild_id)
-        if not list_data:
-            await inter.response.send_message("❌ Список не найден!", ephemeral=True)
-            return
-            
-        user_id = str(inter.author.id)
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
         
-        if user_id not in list_data["participants"]:
-            await inter.response.send_message("❌ Вы не зарегистрированы в этом списке!", ephemeral=True)
-            return
-            
-        if not list_data["participants"][user_id]["has_rollback"]:
-            await inter.response.send_message("❌ У вас нет отправленного отката!", ephemeral=True)
-            return
+    user_id = inter.author.id
+    
+    if user_id not in list_data["participants"]:
+        await inter.response.send_message("❌ Вы не зарегистрированы в этом списке!", ephemeral=True)
+        return
         
-        if await remove_user_rollback(list_data, user_id):
-            await inter.response.send_message(
-                f"✅ Ваш откат удален из списка '{list_data['name']}'!", 
-                ephemeral=True
-            )
-            
-            channel = bot.get_channel(list_data["channel_id"])
-            if channel:
-                await update_participants_message(channel, list_data)
-            await update_status_message(list_data)
-        else:
-            await inter.response.send_message("❌ Не удалось удалить откат!", ephemeral=True)
+    if not list_data["participants"][user_id]["has_rollback"]:
+        await inter.response.send_message("❌ У вас нет отправленного отката!", ephemeral=True)
+        return
+    
+    if await remove_user_rollback(list_data, user_id):
+        await inter.response.send_message(
+            f"✅ Ваш откат удален из списка '{list_data['name']}'!", 
+            ephemeral=True
+        )
         
-        await inter.message.delete()
+        mark_dirty(list_data["id"])
+    else:
+        await inter.response.send_message("❌ Не удалось удалить откат!", ephemeral=True)
     
-    @disnake.ui.button(label="Отмена", style=disnake.ButtonStyle.secondary)
-    async def cancel_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await inter.response.send_message("❌ Удаление отката отменено.", ephemeral=True)
-        await inter.message.delete()
+    await inter.message.delete()
 
-class MainView(disnake.ui.View):
-    def __init__(self, list_id, guild_id):
-        super().__init__(timeout=None)
-        self.list_id = list_id
-        self.guild_id = guild_id
+@button_handler("cancel_delete")
+async def cancel_delete_button(inter: disnake.MessageInteraction, list_id):
+    await inter.response.send_message("❌ Удаление отката отменено.", ephemeral=True)
+    await inter.message.delete()
+
+LIST_ALL_PAGE_SIZE = 10
+
+LIST_ALL_PAGE_SQL = '''
+    SELECT l.id, l.name, l.created_at, l.archived_at,
+        COUNT(p.user_id) AS participants_count,
+        COUNT(p.user_id) FILTER (WHERE p.has_rollback) AS rollbacks_count
+    FROM lists l
+    LEFT JOIN participants p ON p.list_pk = l.pk
+    WHERE l.guild_id = $1 {cursor}
+    GROUP BY l.pk
+    ORDER BY l.created_at DESC, l.id DESC
+    LIMIT $2
+'''
+
+async def fetch_lists_page(guild_id, cursor=None):
+    if cursor is None:
+        return await db.fetch(
+            LIST_ALL_PAGE_SQL.format(cursor=''),
+            guild_id, LIST_ALL_PAGE_SIZE + 1
+        )
     
-    @disnake.ui.button(label="Отправить откат", style=disnake.ButtonStyle.primary)
-    async def rollback_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        list_data = await get_list(self.list_id, self.guild_id)
-        if not list_data:
-            await inter.response.send_message("❌ Список не найден!", ephemeral=True)
-            return
-            
-        user_id = str(inter.author.id)
-        if user_id not in list_data["participants"]:
-            await inter.response.send_message(
-                "❌ Вы не зарегистрированы в этом списке! Обратитесь к администратору.",
-                ephemeral=True
+    return await db.fetch(
+        LIST_ALL_PAGE_SQL.format(cursor='AND (l.created_at, l.id) < ($3, $4)'),
+        guild_id, LIST_ALL_PAGE_SIZE + 1, cursor[0], cursor[1]
+    )
+
+class ListAllView(disnake.ui.View):
+    def __init__(self, guild_id):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.page_cursors = [None]
+        self.rows = []
+        self.has_next = False
+    
+    async def load_page(self):
+        rows = await fetch_lists_page(self.guild_id, self.page_cursors[-1])
+        self.has_next = len(rows) > LIST_ALL_PAGE_SIZE
+        self.rows = rows[:LIST_ALL_PAGE_SIZE]
+        self.prev_button.disabled = len(self.page_cursors) == 1
+        self.next_button.disabled = not self.has_next
+    
+    def build_embed(self):
+        embed = disnake.Embed(title="📋 Все списки", color=0x2b2d31)
+        
+        for row in self.rows:
+            embed.add_field(
+                name=f"{'🗄 ' if row['archived_at'] else ''}{row['name']} (ID: {row['id']})",
+                value=f"Участников: {row['participants_count']}\nОткатов: {row['rollbacks_count']}",
+                inline=True
             )
-            return
         
-        has_existing_rollback = list_data["participants"][user_id]["has_rollback"]
+        embed.set_footer(text=f"Страница {len(self.page_cursors)}")
+        return embed
+    
+    async def on_error(self, error, item, inter):
+        if not await reply_if_database_unavailable(inter, error):
+            await super().on_error(error, item, inter)
+    
+    @disnake.ui.button(label="◀ Назад", style=disnake.ButtonStyle.secondary)
+    async def prev_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        if len(self.page_cursors) > 1:
+            self.page_cursors.pop()
+        await self.load_page()
+        await inter.response.edit_message(embed=self.build_embed(), view=self)
+    
+    @disnake.ui.button(label="Вперед ▶", style=disnake.ButtonStyle.secondary)
+    async def next_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        if self.has_next and self.rows:
+            last_row = self.rows[-1]
+            self.page_cursors.append((last_row['created_at'], last_row['id']))
+        await self.load_page()
+        await inter.response.edit_message(embed=self.build_embed(), view=self)
+
+async def resolve_display_names(guild, user_ids):
+    display_names = {}
+    
+    try:
+        members = await guild.get_or_fetch_members(user_ids)
+    except Exception as e:
+        logger.error(f"❌ Ошибка при получении участников сервера: {e}", extra=log_context(guild_id=guild.id))
+        members = [member for member in map(guild.get_member, user_ids) if member]
+    
+    for member in members:
+        display_names[member.id] = member.display_name
+    
+    # Запросы по одному пользователю дорогие: не участников сервера ищем
+    # не больше USER_LOOKUP_MAX за вызов, остальные считаются не найденными.
+    missing = [user_id for user_id in user_ids if user_id not in display_names][:USER_LOOKUP_MAX]
+    if missing:
+        users = await asyncio.gather(
+            *(
+                outbound.request("users", lambda user_id=user_id: bot.fetch_user(user_id), PRIORITY_INTERACTION)
+                for user_id in missing
+            ),
+            return_exceptions=True
+        )
+        for user in users:
+            if isinstance(user, disnake.User):
+                display_names[user.id] = user.display_name
+    
+    return display_names
+
+def list_id_autocomplete(include_archived=True, admin_only=True):
+    async def autocomplete(inter: disnake.ApplicationCommandInteraction, user_input: str):
+        if inter.guild is None or (admin_only and not is_admin(inter.author)):
+            return []
         
-        if has_existing_rollback:
-            class ChoiceView(disnake.ui.View):
-                def __init__(self, list_id, guild_id):
-                    super().__init__(timeout=60)
-                    self.list_id = list_id
-                    self.guild_id = guild_id
-                
-                @disnake.ui.button(label="Заменить откат", style=disnake.ButtonStyle.primary)
-                async def replace_button(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
-                    await interaction.response.send_modal(RollbackModal(self.list_id, self.guild_id, has_existing_rollback=True))
-                
-                @disnake.ui.button(label="Удалить откат", style=disnake.ButtonStyle.danger)
-                async def delete_button(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
-                    delete_view = DeleteRollbackView(self.list_id, self.guild_id)
-                    await interaction.response.send_message(
-                        "❓ Вы уверены, что хотите удалить свой откат?",
-                        view=delete_view,
-                        ephemeral=True
-                    )
-                
-                @disnake.ui.button(label="Отмена", style=disnake.ButtonStyle.secondary)
-                async def cancel_button(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
-                    await interaction.response.send_message("❌ Действие отменено.", ephemeral=True)
-            
-            choice_view = ChoiceView(self.list_id, self.guild_id)
-            
-            await inter.response.send_message(
-                "📝 У вас уже есть отправленный откат. Что вы хотите сделать?",
-                view=choice_view,
-                ephemeral=True
-            )
-        else:
-            await inter.response.send_modal(RollbackModal(self.list_id, self.guild_id, has_existing_rollback=False))
+        choices = {}
+        for entry in list_index.search(inter.guild.id, user_input, include_archived):
+            label = f"{'🗄 ' if entry['archived'] else ''}{entry['id']} — {entry['name']}"
+            choices[label if len(label) <= 100 else label[:99] + "…"] = entry["id"]
+        return choices
     
-    @disnake.ui.button(label="Обновить список", style=disnake.ButtonStyle.secondary)
-    async def refresh_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await inter.response.defer(ephemeral=True)
-        list_data = await get_list(self.list_id, self.guild_id)
-        if not list_data:
-            await inter.followup.send("❌ Список не найден!", ephemeral=True)
-            return
-            
-        channel = bot.get_channel(list_data["channel_id"])
-        if channel:
-            await update_participants_message(channel, list_data)
-        await update_status_message(list_data)
-        await inter.edit_original_response(content="✅ Оба списка обновлены!")
+    return autocomplete
 
 @bot.slash_command(description="Создать новый список откатов")
 async def create_list(inter: disnake.ApplicationCommandInteraction):
@@ -700,41 +2476,47 @@ async def register_user(
         await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
         return
     
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
+    
     user_mentions = re.findall(r'<@!?(\d+)>', users)
     user_ids = re.findall(r'\b(\d{17,19})\b', users)
     
-    all_user_ids = list(set(user_mentions + user_ids))
+    all_user_ids = [int(user_id) for user_id in dict.fromkeys(user_mentions + user_ids)]
     
     if not all_user_ids:
         await inter.response.send_message("❌ Не найдено ни одного валидного пользователя!", ephemeral=True)
         return
     
-    registered_users = []
-    already_registered = []
+    await inter.response.defer(ephemeral=True)
     
-    for user_id in all_user_ids:
-        try:
-            member = inter.guild.get_member(int(user_id))
-            if not member:
-                member = await bot.fetch_user(int(user_id))
-            
-            server_nickname = member.display_name
-            
-            existing = await db.pool.fetchrow(
-                'SELECT 1 FROM participants WHERE user_id = $1 AND list_id = $2',
-                user_id, list_id
-            )
-            
-            if existing:
-                already_registered.append(server_nickname)
-            else:
-                await db.pool.execute('''
-                    INSERT INTO participants (user_id, list_id, display_name)
-                    VALUES ($1, $2, $3)
-                ''', user_id, list_id, server_nickname)
-                registered_users.append(server_nickname)
-        except:
-            continue
+    display_names = await resolve_display_names(inter.guild, all_user_ids)
+    resolved_ids = [user_id for user_id in all_user_ids if user_id in display_names]
+    
+    rows = []
+    if resolved_ids:
+        rows = await db.fetch('''
+            INSERT INTO participants (user_id, list_pk, display_name, registered_at)
+            SELECT u.user_id, $1, u.display_name, clock_timestamp()
+            FROM unnest($2::bigint[], $3::text[]) WITH ORDINALITY AS u(user_id, display_name, position)
+            ORDER BY u.position
+            ON CONFLICT (list_pk, user_id) DO NOTHING
+            RETURNING user_id, display_name, registered_at
+        ''', list_data["pk"], resolved_ids, [display_names[user_id] for user_id in resolved_ids])
+    
+    for row in rows:
+        list_data["participants"][row['user_id']] = {
+            "display_name": row['display_name'],
+            "has_rollback": False,
+            "registered_at": row['registered_at'].isoformat()
+        }
+    if rows:
+        touch_list(list_data)
+    
+    newly_registered = {row['user_id'] for row in rows}
+    registered_users = [display_names[user_id] for user_id in resolved_ids if user_id in newly_registered]
+    already_registered = [display_names[user_id] for user_id in resolved_ids if user_id not in newly_registered]
     
     if registered_users or already_registered:
         response = []
@@ -743,14 +2525,14 @@ async def register_user(
         if already_registered:
             response.append(f"ℹ️ Уже были зарегистрированы: {', '.join(already_registered)}")
         
-        await inter.response.send_message("\n".join(response), ephemeral=True)
+        await inter.edit_original_response(content="\n".join(response))
         
-        channel = bot.get_channel(list_data["channel_id"])
-        if channel:
-            await update_participants_message(channel, list_data)
-        await update_status_message(list_data)
+        if rows:
+            mark_dirty(list_data["id"])
     else:
-        await inter.response.send_message("❌ Не удалось зарегистрировать ни одного пользователя!", ephemeral=True)
+        await inter.edit_original_response(content="❌ Не удалось зарегистрировать ни одного пользователя!")
+
+register_user.autocomplete("list_id")(list_id_autocomplete(include_archived=False))
 
 @bot.slash_command(description="Показать список откатов")
 async def show_list(
@@ -774,9 +2556,11 @@ async def show_list(
     await inter.edit_original_response(
         content=f"✅ Список '{list_data['name']}' отображен!",
         embed=embed,
-        view=MainView(list_data["id"], inter.guild.id)
+        components=[] if is_archived(list_data) else main_components(list_data["id"])
     )
 
+show_list.autocomplete("list_id")(list_id_autocomplete(admin_only=False))
+
 @bot.slash_command(description="Удалить пользователя из списка")
 async def remove_user(
     inter: disnake.ApplicationCommandInteraction,
@@ -792,29 +2576,26 @@ async def remove_user(
         await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
         return
     
-    user_id = str(user.id)
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
     
-    existing = await db.pool.fetchrow(
-        'SELECT 1 FROM participants WHERE user_id = $1 AND list_id = $2',
-        user_id, list_id
-    )
+    user_id = user.id
     
-    if not existing:
+    if user_id not in list_data["participants"]:
         await inter.response.send_message("❌ Пользователь не зарегистрирован в этом списке!", ephemeral=True)
         return
     
     member = inter.guild.get_member(user.id)
     server_nickname = member.display_name if member else user.display_name
     
-    await db.pool.execute('DELETE FROM participants WHERE user_id = $1 AND list_id = $2', user_id, list_id)
-    await db.pool.execute('DELETE FROM rollbacks WHERE user_id = $1 AND list_id = $2', user_id, list_id)
+    await remove_participant(list_data, user_id)
     
     await inter.response.send_message(f"✅ Пользователь {server_nickname} удален из списка '{list_data['name']}'!", ephemeral=True)
     
-    channel = bot.get_channel(list_data["channel_id"])
-    if channel:
-        await update_participants_message(channel, list_data)
-    await update_status_message(list_data)
+    mark_dirty(list_data["id"])
+
+remove_user.autocomplete("list_id")(list_id_autocomplete(include_archived=False))
 
 @bot.slash_command(description="Удалить весь список")
 async def delete_list(
@@ -830,13 +2611,15 @@ async def delete_list(
         await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
         return
     
-    await db.pool.execute('DELETE FROM lists WHERE id = $1', list_id)
+    await db.execute('DELETE FROM lists WHERE pk = $1', list_data["pk"])
     
-    if list_id in active_lists:
-        del active_lists[list_id]
+    evict_list(list_id)
+    list_index.remove(list_id)
     
     await inter.response.send_message(f"✅ Список '{list_data['name']}' (ID: {list_id}) полностью удален!", ephemeral=True)
 
+delete_list.autocomplete("list_id")(list_id_autocomplete())
+
 @bot.slash_command(description="Сбросить откаты всех участников")
 async def reset_rollbacks(
     inter: disnake.ApplicationCommandInteraction,
@@ -851,18 +2634,17 @@ async def reset_rollbacks(
         await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
         return
     
-    await db.pool.execute('''
-        UPDATE participants SET has_rollback = FALSE WHERE list_id = $1
-    ''', list_id)
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
     
-    await db.pool.execute('DELETE FROM rollbacks WHERE list_id = $1', list_id)
+    await clear_rollbacks(list_data)
     
     await inter.response.send_message(f"✅ Все откаты в списке '{list_data['name']}' сброшены!", ephemeral=True)
     
-    channel = bot.get_channel(list_data["channel_id"])
-    if channel:
-        await update_participants_message(channel, list_data)
-    await update_status_message(list_data)
+    mark_dirty(list_data["id"])
+
+reset_rollbacks.autocomplete("list_id")(list_id_autocomplete(include_archived=False))
 
 @bot.slash_command(description="Посмотреть все списки")
 async def list_all(inter: disnake.ApplicationCommandInteraction):
@@ -870,29 +2652,500 @@ async def list_all(inter: disnake.ApplicationCommandInteraction):
         await inter.response.send_message("❌ У вас нет прав для выполнения этой команды!", ephemeral=True)
         return
     
-    rows = await db.pool.fetch('SELECT * FROM lists WHERE guild_id = $1', inter.guild.id)
+    view = ListAllView(inter.guild.id)
+    await view.load_page()
     
-    if not rows:
+    if not view.rows:
         await inter.response.send_message("📋 Списков пока нет!", ephemeral=True)
         return
     
-    embed = disnake.Embed(title="📋 Все списки", color=0x2b2d31)
+    await inter.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+EXPORT_BATCH_SIZE = 500
+EXPORT_SPOOL_BYTES = int(os.getenv('EXPORT_SPOOL_BYTES', str(4 * 1024 * 1024)))
+EXPORT_MAX_BYTES = int(os.getenv('EXPORT_MAX_BYTES', str(10 * 1024 * 1024)))
+
+EXPORT_COLUMNS = [
+    "list_id", "list_name", "event_at", "user_id", "display_name",
+    "has_rollback", "registered_at", "rollback_text", "rollback_at"
+]
+
+EXPORT_SQL = '''
+    SELECT l.id AS list_id, l.name AS list_name, l.event_at,
+        p.user_id, p.display_name, p.has_rollback, p.registered_at,
+        r.text AS rollback_text, r.timestamp AS rollback_at
+    FROM lists l
+    JOIN participants p ON p.list_pk = l.pk
+    LEFT JOIN rollbacks r ON r.list_pk = p.list_pk AND r.user_id = p.user_id
+    WHERE {filter}
+    ORDER BY COALESCE(l.event_at, l.created_at), l.pk, p.registered_at
+'''
+
+def export_record(row):
+    return {
+        "list_id": row['list_id'],
+        "list_name": row['list_name'],
+        "event_at": row['event_at'].isoformat() if row['event_at'] else None,
+        "user_id": str(row['user_id']),
+        "display_name": row['display_name'],
+        "has_rollback": row['has_rollback'],
+        "registered_at": row['registered_at'].isoformat(),
+        "rollback_text": row['rollback_text'],
+        "rollback_at": row['rollback_at'].isoformat() if row['rollback_at'] else None
+    }
+
+def encode_export_batch(stream, export_format, rows):
+    if export_format == "csv":
+        writer = csv.writer(stream)
+        for row in rows:
+            record = export_record(row)
+            writer.writerow(["" if record[column] is None else record[column] for column in EXPORT_COLUMNS])
+    else:
+        for row in rows:
+            stream.write(json.dumps(export_record(row), ensure_ascii=False) + "\n")
+
+class ExportWriteError(Exception):
+    pass
+
+async def encode_export_rows(stream, export_format, rows):
+    try:
+        await asyncio.to_thread(encode_export_batch, stream, export_format, rows)
+    except OSError as e:
+        # Ошибка записи во временный файл (например, кончилось место на диске)
+        # поднимается отдельным типом, чтобы transaction не принял ее за сбой базы.
+        raise ExportWriteError(str(e)) from e
+
+async def write_export(export_format, query, *args):
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    # utf-8-sig, чтобы Excel правильно открывал кириллицу в CSV.
+    stream = io.TextIOWrapper(buffer, encoding="utf-8-sig" if export_format == "csv" else "utf-8", newline="")
+    total = 0
+    
+    try:
+        if export_format == "csv":
+            csv.writer(stream).writerow(EXPORT_COLUMNS)
+        
+        batch = []
+        async with db.transaction() as conn:
+            async for row in conn.cursor(query, *args, prefetch=EXPORT_BATCH_SIZE):
+                batch.append(row)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    await encode_export_rows(stream, export_format, batch)
+                    total += len(batch)
+                    batch = []
+        
+        if batch:
+            await encode_export_rows(stream, export_format, batch)
+            total += len(batch)
+        
+        stream.flush()
+        size = buffer.tell()
+        stream.detach()
+        buffer.seek(0)
+    except Exception:
+        stream.close()
+        raise
+    
+    return buffer, total, size
+
+@bot.slash_command(description="Выгрузить участников и полные тексты откатов в файл")
+async def export_list(
+    inter: disnake.ApplicationCommandInteraction,
+    list_id: str = commands.Param(default=None, description="ID списка (не указывайте для выгрузки за период)"),
+    export_format: str = commands.Param(name="format", default="csv", choices=EXPORT_FORMATS, description="Формат файла"),
+    date_from: str = commands.Param(default=None, description="Начало периода, например 01.10.2025"),
+    date_to: str = commands.Param(default=None, description="Конец периода включительно, например 31.10.2025")
+):
+    if not is_admin(inter.author):
+        await inter.response.send_message("❌ У вас нет прав для выполнения этой команды!", ephemeral=True)
+        return
+    
+    if list_id:
+        list_data = await get_list(list_id, inter.guild.id)
+        if not list_data:
+            await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
+            return
+        
+        query = EXPORT_SQL.format(filter='l.pk = $1')
+        args = [list_data["pk"]]
+        filename = f"rollbacks_{list_data['id']}.{export_format}"
+    else:
+        if not date_from:
+            await inter.response.send_message("❌ Укажите list_id или начало периода date_from!", ephemeral=True)
+            return
+        
+        period_start = parse_period_date(date_from)
+        period_end = parse_period_date(date_to) if date_to else event_now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if not period_start or not period_end:
+            await inter.response.send_message("❌ Не удалось разобрать даты! Используйте формат 25.10.2025.", ephemeral=True)
+            return
+        if period_end < period_start:
+            await inter.response.send_message("❌ Конец периода раньше его начала!", ephemeral=True)
+            return
+        
+        event_time = f"COALESCE(l.event_at, {db_to_event_clock('l.created_at')})"
+        query = EXPORT_SQL.format(
+            filter=f'l.guild_id = $1 AND {event_time} >= $2 AND {event_time} < $3'
+        )
+        args = [inter.guild.id, period_start, period_end + timedelta(days=1)]
+        filename = f"rollbacks_{period_start:%Y%m%d}_{period_end:%Y%m%d}.{export_format}"
     
-    for row in rows:
-        participants_count = await db.pool.fetchval(
-            'SELECT COUNT(*) FROM participants WHERE list_id = $1', row['id']
+    await inter.response.defer(ephemeral=True)
+    
+    try:
+        buffer, total, size = await write_export(export_format, query, *args)
+    except ExportWriteError as e:
+        logger.error(f"❌ Не удалось записать файл выгрузки: {e}", extra=log_context(guild_id=inter.guild.id))
+        await inter.edit_original_response(content="❌ Не удалось подготовить файл выгрузки. Попробуйте позже.")
+        return
+    try:
+        if not total:
+            await inter.edit_original_response(content="❌ Нет данных для выгрузки!")
+            return
+        
+        if size > EXPORT_MAX_BYTES:
+            await inter.edit_original_response(
+                content=f"❌ Файл слишком большой ({size // 1024} КБ). Сократите период выгрузки."
+            )
+            return
+        
+        await inter.edit_original_response(
+            content=f"✅ Выгружено строк: {total}",
+            file=disnake.File(buffer, filename=filename)
         )
-        rollbacks_count = await db.pool.fetchval(
-            'SELECT COUNT(*) FROM participants WHERE list_id = $1 AND has_rollback = TRUE', row['id']
+    finally:
+        buffer.close()
+
+export_list.autocomplete("list_id")(list_id_autocomplete())
+
+IMPORT_EXTENSIONS = (".csv", ".json", ".jsonl")
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(2 * 1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '5000'))
+IMPORT_MAX_ERRORS = 10
+IMPORT_USER_ID_RE = re.compile(r'\d{17,19}')
+
+IMPORT_COLUMNS = ["user_id", "display_name", "rollback_text", "position"]
+
+IMPORT_MERGE_SQL = '''
+    WITH registered AS (
+        INSERT INTO participants (user_id, list_pk, display_name, has_rollback, registered_at)
+        SELECT user_id, $1, display_name, rollback_text IS NOT NULL, clock_timestamp()
+        FROM import_rows
+        ORDER BY position
+        ON CONFLICT (list_pk, user_id) DO UPDATE SET
+            has_rollback = participants.has_rollback OR EXCLUDED.has_rollback,
+            display_name = CASE WHEN EXCLUDED.has_rollback THEN EXCLUDED.display_name ELSE participants.display_name END
+        RETURNING xmax = 0 AS inserted
+    ), rollbacks AS (
+        INSERT INTO rollbacks (user_id, list_pk, user_name, text)
+        SELECT user_id, $1, display_name, rollback_text
+        FROM import_rows
+        WHERE rollback_text IS NOT NULL
+        ON CONFLICT (list_pk, user_id)
+        DO UPDATE SET user_name = EXCLUDED.user_name, text = EXCLUDED.text, timestamp = NOW()
+        RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FILTER (WHERE inserted) FROM registered) AS registered,
+        (SELECT COUNT(*) FROM registered) AS total,
+        (SELECT COUNT(*) FROM rollbacks) AS rollbacks
+'''
+
+def iter_import_items(data, filename):
+    text = data.decode("utf-8-sig")
+    
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        if not reader.fieldnames or "user_id" not in reader.fieldnames:
+            raise ValueError("нет колонки user_id")
+        for item in reader:
+            yield f"строка {reader.line_num}", item
+    elif text.lstrip().startswith("["):
+        for position, item in enumerate(json.loads(text), 1):
+            yield f"запись {position}", item
+    else:
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                yield f"строка {line_number}", json.loads(line)
+
+def parse_import(data, filename):
+    records = {}
+    errors = []
+    
+    try:
+        for location, item in iter_import_items(data, filename):
+            if not isinstance(item, dict):
+                errors.append(f"{location}: ожидался объект с полем user_id")
+            else:
+                user_id = str(item.get("user_id") or "").strip()
+                display_name = str(item.get("display_name") or "").strip()
+                rollback_text = clean_rollback_text(str(item.get("rollback_text") or ""))
+                
+                # user_id уходит в BIGINT: значения от 2**63 не поместятся в колонку.
+                if not IMPORT_USER_ID_RE.fullmatch(user_id) or int(user_id) >= 2**63:
+                    errors.append(f"{location}: неверный user_id")
+                elif len(display_name) > 100:
+                    errors.append(f"{location}: имя длиннее 100 символов")
+                elif len(rollback_text) > 2000:
+                    errors.append(f"{location}: откат длиннее 2000 символов")
+                else:
+                    records[int(user_id)] = (display_name or None, rollback_text or None)
+            
+            if len(errors) >= IMPORT_MAX_ERRORS:
+                break
+            if len(records) > IMPORT_MAX_ROWS:
+                errors.append(f"в файле больше {IMPORT_MAX_ROWS} участников")
+                break
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        errors.append(f"файл не читается: {e}")
+    
+    return records, errors
+
+async def import_participants(list_pk, rows):
+    async with db.transaction() as conn:
+        await conn.execute('''
+            CREATE TEMP TABLE import_rows (
+                user_id BIGINT NOT NULL,
+                display_name TEXT NOT NULL,
+                rollback_text TEXT,
+                position INTEGER NOT NULL
+            ) ON COMMIT DROP
+        ''')
+        await conn.copy_records_to_table('import_rows', records=rows, columns=IMPORT_COLUMNS)
+        return await conn.fetchrow(IMPORT_MERGE_SQL, list_pk)
+
+@bot.slash_command(description="Загрузить участников и откаты из CSV или JSON файла")
+async def import_list(
+    inter: disnake.ApplicationCommandInteraction,
+    list_id: str = commands.Param(description="ID списка"),
+    file: disnake.Attachment = commands.Param(description="CSV или JSON с колонками user_id, display_name, rollback_text")
+):
+    if not is_admin(inter.author):
+        await inter.response.send_message("❌ У вас нет прав для выполнения этой команды!", ephemeral=True)
+        return
+    
+    list_data = await get_list(list_id, inter.guild.id)
+    if not list_data:
+        await inter.response.send_message("❌ Список с таким ID не найден!", ephemeral=True)
+        return
+    
+    if is_archived(list_data):
+        await inter.response.send_message(ARCHIVED_LIST_MESSAGE, ephemeral=True)
+        return
+    
+    if not file.filename.lower().endswith(IMPORT_EXTENSIONS):
+        await inter.response.send_message("❌ Поддерживаются только файлы .csv, .json и .jsonl!", ephemeral=True)
+        return
+    
+    if file.size > IMPORT_MAX_BYTES:
+        await inter.response.send_message(
+            f"❌ Файл слишком большой ({file.size // 1024} КБ, максимум {IMPORT_MAX_BYTES // 1024} КБ)!", ephemeral=True
         )
+        return
+    
+    await inter.response.defer(ephemeral=True)
+    
+    records, errors = await asyncio.to_thread(parse_import, await file.read(), file.filename)
+    if errors:
+        await inter.edit_original_response(content="❌ Файл не импортирован:\n" + "\n".join(errors))
+        return
+    
+    if not records:
+        await inter.edit_original_response(content="❌ В файле нет участников!")
+        return
+    
+    unnamed = [user_id for user_id, (display_name, _) in records.items() if not display_name]
+    display_names = await resolve_display_names(inter.guild, unnamed) if unnamed else {}
+    
+    rows = []
+    not_found = []
+    for position, (user_id, (display_name, rollback_text)) in enumerate(records.items()):
+        display_name = display_name or display_names.get(user_id)
+        if display_name:
+            rows.append((user_id, display_name, rollback_text, position))
+        else:
+            not_found.append(str(user_id))
+    
+    if not rows:
+        await inter.edit_original_response(content="❌ Не удалось найти ни одного пользователя из файла!")
+        return
+    
+    result = await import_participants(list_data["pk"], rows)
+    
+    await get_list(list_data["id"], inter.guild.id, refresh=True)
+    mark_dirty(list_data["id"])
+    
+    response = [
+        f"✅ Импорт в список '{list_data['name']}' завершен!",
+        f"Новых участников: {result['registered']}",
+        f"Уже были зарегистрированы: {result['total'] - result['registered']}",
+        f"Загружено откатов: {result['rollbacks']}"
+    ]
+    if not_found:
+        response.append(f"⚠️ Не найдены пользователи: {', '.join(not_found[:20])}{' и другие' if len(not_found) > 20 else ''}")
+    
+    await inter.edit_original_response(content="\n".join(response))
+
+import_list.autocomplete("list_id")(list_id_autocomplete(include_archived=False))
+
+SEARCH_PAGE_SIZE = 5
+SEARCH_HIGHLIGHT_START = "\x02"
+SEARCH_HIGHLIGHT_STOP = "\x03"
+
+# Условие поиска строится только из russian: объединение с simple через ||
+# превращает "-слово" в "!форма1 | !форма2" и ломает исключения. simple
+# нужен для запросов из одних стоп-слов и для подсветки точных форм.
+SEARCH_TSQUERY = "(CASE WHEN numnode(websearch_to_tsquery('russian', $2)) > 0 THEN websearch_to_tsquery('russian', $2) ELSE websearch_to_tsquery('simple', $2) END)"
+SEARCH_HIGHLIGHT_TSQUERY = "(websearch_to_tsquery('russian', $2) || websearch_to_tsquery('simple', $2))"
+
+# ts_headline дорогой, поэтому считается только для строк уже отобранной страницы.
+SEARCH_SQL = f'''
+    SELECT page.*,
+        ts_headline('russian', page.text, {SEARCH_HIGHLIGHT_TSQUERY},
+            'StartSel={SEARCH_HIGHLIGHT_START}, StopSel={SEARCH_HIGHLIGHT_STOP}, MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=" … "'
+        ) AS snippet
+    FROM (
+        SELECT r.list_pk, r.user_id, r.user_name, r.text, r.timestamp, l.id AS list_id, l.name AS list_name
+        FROM rollbacks r
+        JOIN lists l ON l.pk = r.list_pk
+        WHERE r.search_vector @@ {SEARCH_TSQUERY} AND l.guild_id = $1 {{filters}}
+        ORDER BY r.timestamp DESC, r.list_pk DESC, r.user_id DESC
+        LIMIT $3
+    ) page
+    ORDER BY page.timestamp DESC, page.list_pk DESC, page.user_id DESC
+'''
+
+async def fetch_search_page(guild_id, query, filters, cursor=None):
+    conditions = []
+    args = [guild_id, query, SEARCH_PAGE_SIZE + 1]
+    
+    for condition, value in filters:
+        args.append(value)
+        conditions.append(condition.format(f"${len(args)}"))
+    
+    if cursor is not None:
+        args.extend(cursor)
+        conditions.append(f"(r.timestamp, r.list_pk, r.user_id) < (${len(args) - 2}, ${len(args) - 1}, ${len(args)})")
+    
+    return await db.fetch(
+        SEARCH_SQL.format(filters="".join(f"AND {condition} " for condition in conditions)),
+        *args
+    )
+
+def format_snippet(snippet):
+    snippet = disnake.utils.escape_markdown(snippet)
+    snippet = snippet.replace(SEARCH_HIGHLIGHT_START, "**").replace(SEARCH_HIGHLIGHT_STOP, "**")
+    return snippet if len(snippet) <= 900 else snippet[:900] + "…"
+
+class SearchRollbacksView(disnake.ui.View):
+    def __init__(self, guild_id, query, filters):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.query = query
+        self.filters = filters
+        self.page_cursors = [None]
+        self.rows = []
+        self.has_next = False
+    
+    async def load_page(self):
+        rows = await fetch_search_page(self.guild_id, self.query, self.filters, self.page_cursors[-1])
+        self.has_next = len(rows) > SEARCH_PAGE_SIZE
+        self.rows = rows[:SEARCH_PAGE_SIZE]
+        self.prev_button.disabled = len(self.page_cursors) == 1
+        self.next_button.disabled = not self.has_next
+    
+    def build_embed(self):
+        embed = disnake.Embed(title=f"🔎 Поиск: {self.query}"[:256], color=0x2b2d31)
         
-        embed.add_field(
-            name=f"{row['name']} (ID: {row['id']})",
-            value=f"Участников: {participants_count}\nОткатов: {rollbacks_count}",
-            inline=True
-        )
+        for row in self.rows:
+            embed.add_field(
+                name=f"{row['user_name']} — {row['list_name']}"[:256],
+                value=f"{format_snippet(row['snippet'])}\n"
+                      f"ID списка: {row['list_id']} • {row['timestamp'].strftime('%d.%m.%Y %H:%M')}",
+                inline=False
+            )
+        
+        embed.set_footer(text=f"Страница {len(self.page_cursors)}")
+        return embed
+    
+    async def on_error(self, error, item, inter):
+        if not await reply_if_database_unavailable(inter, error):
+            await super().on_error(error, item, inter)
+    
+    @disnake.ui.button(label="◀ Назад", style=disnake.ButtonStyle.secondary)
+    async def prev_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        if len(self.page_cursors) > 1:
+            self.page_cursors.pop()
+        await self.load_page()
+        await inter.response.edit_message(embed=self.build_embed(), view=self)
+    
+    @disnake.ui.button(label="Вперед ▶", style=disnake.ButtonStyle.secondary)
+    async def next_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        if self.has_next and self.rows:
+            last_row = self.rows[-1]
+            self.page_cursors.append((last_row['timestamp'], last_row['list_pk'], last_row['user_id']))
+        await self.load_page()
+        await inter.response.edit_message(embed=self.build_embed(), view=self)
+
+@bot.slash_command(description="Найти откаты по тексту")
+async def search_rollbacks(
+    inter: disnake.ApplicationCommandInteraction,
+    query: str = commands.Param(max_length=200, description="Слова для поиска, \"точная фраза\" или -исключение"),
+    list_id: str = commands.Param(default=None, description="Искать только в этом списке"),
+    date_from: str = commands.Param(default=None, description="Откаты не раньше этой даты, например 01.10.2025"),
+    date_to: str = commands.Param(default=None, description="Откаты не позже этой даты включительно")
+):
+    if not is_admin(inter.author):
+        await inter.response.send_message("❌ У вас нет прав для выполнения этой команды!", ephemeral=True)
+        return
+    
+    filters = []
+    if list_id:
+        filters.append(("l.id = {}", list_id))
+    
+    for value, operator, shift in ((date_from, ">=", 0), (date_to, "<", 1)):
+        if not value:
+            continue
+        period_date = parse_period_date(value)
+        if not period_date:
+            await inter.response.send_message("❌ Не удалось разобрать даты! Используйте формат 25.10.2025.", ephemeral=True)
+            return
+        filters.append((f"r.timestamp {operator} {event_to_db_clock('{}')}", period_date + timedelta(days=shift)))
+    
+    view = SearchRollbacksView(inter.guild.id, query.strip(), filters)
+    await view.load_page()
+    
+    if not view.rows:
+        await inter.response.send_message("🔎 Ничего не найдено!", ephemeral=True)
+        return
+    
+    await inter.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+search_rollbacks.autocomplete("list_id")(list_id_autocomplete())
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+metrics_runner = None
+
+async def handle_metrics(request):
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+async def start_metrics_server():
+    global metrics_runner
+    if not METRICS_PORT or metrics_runner is not None:
+        return
     
-    await inter.response.send_message(embed=embed, ephemeral=True)
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"✅ Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
 
 async def main():
     max_retries = 3
@@ -900,24 +3153,29 @@ async def main():
     
     for attempt in range(max_retries):
         try:
-            print(f"🔄 Попытка подключения к базе данных {attempt + 1}/{max_retries}...")
+            logger.info(f"🔄 Попытка подключения к базе данных {attempt + 1}/{max_retries}...")
             await db.connect()
             break
         except Exception as e:
-            print(f"❌ Попытка {attempt + 1} не удалась: {e}")
+            logger.error(f"❌ Попытка {attempt + 1} не удалась: {e}")
             if attempt < max_retries - 1:
-                print(f"⏳ Ждем {retry_delay} секунд перед следующей попыткой...")
+                logger.info(f"⏳ Ждем {retry_delay} секунд перед следующей попыткой...")
                 await asyncio.sleep(retry_delay)
             else:
-                print("❌ Все попытки подключения провалились!")
+                logger.error("❌ Все попытки подключения провалились!")
                 raise
     
     token = os.getenv('DISCORD_BOT_TOKEN')
     if not token:
-        print("❌ DISCORD_BOT_TOKEN не найден!")
+        logger.error("❌ DISCORD_BOT_TOKEN не найден!")
         exit(1)
     
-    print("🚀 Запускаем бота...")
+    try:
+        await start_metrics_server()
+    except Exception as e:
+        logger.error(f"❌ Не удалось запустить сервер метрик: {e}")
+    
+    logger.info("🚀 Запускаем бота...")
     await bot.start(token)
 
 if __name__ == "__main__":